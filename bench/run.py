@@ -0,0 +1,293 @@
+"""solved.ac 대신 bench.stub_server를 띄워 크롤링과 API 성능을 잰다.
+
+    python -m bench.run crawl --members 100 1000 10000
+    python -m bench.run crawl --members 1000 --latency-ms 30 --jitter-ms 20 --error-rate 0.02
+    python -m bench.run api --members 1000 --requests 300 --concurrency 16
+    python -m bench.run all --json bench.json
+
+crawl은 멤버 수마다 처음 크롤링(cold)과, 하루가 지나 일부 멤버만 바뀐 뒤의 증분 크롤링(warm)을 재서
+걸린 시간, solved.ac로 보낸 요청 수(429 포함), 크롤링 프로세스의 최대 메모리(RSS)를 보고한다.
+api는 크롤링 결과로 main.py의 모든 GET 경로를 호출해 지연 시간(p50/p95/p99)과 처리량을 보고한다.
+캐시된 응답과 응답 캐시를 끄고 매번 새로 만드는 응답을 따로 잰다.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get_json(url: str):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+@contextmanager
+def stub_server(args: argparse.Namespace, members: int):
+    port = _free_port()
+    command = [sys.executable, "-m", "bench.stub_server", "--port", str(port), "--members", str(members),
+               "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+               "--error-rate", str(args.error_rate), "--retry-after", str(args.retry_after),
+               "--drift", str(args.drift), "--seed", str(args.seed)]
+    process = subprocess.Popen(command, cwd=REPO_ROOT)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(600):
+            try:
+                _get_json(f"{url}/_stats")
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("stub server did not start")
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _run_worker(mode: str, workdir: str, env: dict) -> dict:
+    """크롤링/API 측정은 결과 디렉터리에서 새 프로세스로 돌려 메모리와 설정이 섞이지 않게 한다."""
+    output = subprocess.run([sys.executable, "-m", "bench.run", mode], cwd=workdir, check=True,
+                            env={**os.environ, **env, "PYTHONPATH": REPO_ROOT}, stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def _crawl_env(args: argparse.Namespace, base_url: str) -> dict:
+    return {
+            "SOLVEDAC_BASE_URL": f"{base_url}/api/v3",
+            "CRAWL_CONCURRENCY": str(args.concurrency),
+            "CRAWL_RATE_LIMIT" : str(args.rate_limit),
+            "CRAWL_RESUME"     : "0",
+    }
+
+
+def _measure_crawl(base_url: str, workdir: str, env: dict) -> dict:
+    before = _get_json(f"{base_url}/_stats")
+    result = _run_worker("_crawl", workdir, env)
+    after = _get_json(f"{base_url}/_stats")
+    return {**result,
+            "requests" : after["requests"] - before["requests"],
+            "throttled": after["throttled"] - before["throttled"]}
+
+
+def bench_crawl(args: argparse.Namespace) -> list[dict]:
+    results = []
+    for members in args.members:
+        with stub_server(args, members) as base_url, tempfile.TemporaryDirectory() as workdir:
+            env = _crawl_env(args, base_url)
+            cold = _measure_crawl(base_url, workdir, env)
+            _get_json(f"{base_url}/_advance")
+            warm = _measure_crawl(base_url, workdir, env)
+
+        for run, result in (("cold", cold), ("warm", warm)):
+            results.append({"members": members, "run": run, **result})
+            print(f"crawl members={members:>6} {run}: {result['wall_s']:8.2f}s  requests={result['requests']:>7} "
+                  f"(429: {result['throttled']})  peak_rss={result['peak_rss_mb']:.1f}MB", flush=True)
+    return results
+
+
+def bench_api(args: argparse.Namespace) -> list[dict]:
+    results = []
+    for members in args.members:
+        with stub_server(args, members) as base_url, tempfile.TemporaryDirectory() as workdir:
+            _run_worker("_crawl", workdir, _crawl_env(args, base_url))
+            result = _run_worker("_api", workdir, {"BENCH_REQUESTS"   : str(args.requests),
+                                                   "BENCH_CONCURRENCY": str(args.api_concurrency)})
+
+        for route in result["routes"]:
+            results.append({"members": members, **route})
+            print(f"api members={members:>6} {route['url'][:60]:<60} "
+                  f"first={route['first_ms']:8.2f}ms  "
+                  f"cached p50/p95/p99={route['cached']['p50_ms']:.2f}/{route['cached']['p95_ms']:.2f}/"
+                  f"{route['cached']['p99_ms']:.2f}ms {route['cached']['rps']:.0f}rps  "
+                  f"uncached p50/p95/p99={route['uncached']['p50_ms']:.2f}/{route['uncached']['p95_ms']:.2f}/"
+                  f"{route['uncached']['p99_ms']:.2f}ms {route['uncached']['rps']:.0f}rps  "
+                  f"{route['bytes']}B", flush=True)
+        for path in result["not_benchmarked"]:
+            print(f"api members={members:>6} WARNING: {path} has no benchmark sample", flush=True)
+    return results
+
+
+def _peak_rss_mb() -> float:
+    # 리눅스의 ru_maxrss는 KB 단위다.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _crawl_worker() -> dict:
+    import crawl
+
+    started = time.perf_counter()
+    crawl.main()
+    return {"wall_s": time.perf_counter() - started, "peak_rss_mb": _peak_rss_mb()}
+
+
+def _api_samples(snapshot) -> list[str]:
+    handle = snapshot.user_records[0]['handle'] if snapshot.user_records else "none"
+    problem_id = next(iter(snapshot.problem_index.records), 1000)
+    tag_id = snapshot.tag_records[0]['tag_id'] if snapshot.tag_records else 1
+    us = snapshot.organization_record['name']
+    rivals = [record['name'] for record in snapshot.high_school_index.records[:20] if record['name'] != us]
+    rival = rivals[0] if rivals else us
+
+    return [
+            "/organizations",
+            "/organization",
+            "/updated",
+            "/user",
+            "/user?fields=handle,rating,tier&limit=100",
+            "/problem/level",
+            "/problem/level?level_id=15",
+            "/problem/tag",
+            f"/problem/tag?tag_id={tag_id}",
+            "/problem",
+            f"/problem?problem_id={problem_id}",
+            "/problem?sort=tier_avg&order=desc&limit=100",
+            f"/problem?handle={handle}&limit=100",
+            f"/vs/high_school?hs_name={rival}",
+            "/vs/high_school/batch?" + "&".join(f"hs_name={name}" for name in rivals),
+            f"/high_school/search?q={rival[:1]}",
+            "/high_school/neighbors?k=10",
+            "/leaderboard/rating?limit=100",
+            f"/leaderboard/solved_count/rank?handle={handle}",
+            f"/leaderboard/vote_count/window?handle={handle}&k=10",
+            f"/history/user?key={handle}",
+            "/history/organization",
+            "/history/user/diff",
+    ]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def _response_cache(app):
+    from response_cache import ResponseCacheMiddleware
+
+    layer = app.middleware_stack
+    while layer is not None and not isinstance(layer, ResponseCacheMiddleware):
+        layer = getattr(layer, "app", None)
+    return layer
+
+
+async def _bench_url(client, url: str, requests: int, concurrency: int) -> dict:
+    latencies = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for _ in counter:
+            started = time.perf_counter()
+            response = await client.get(url)
+            await response.aread()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {"p50_ms": _percentile(latencies, 50), "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99), "rps": requests / elapsed}
+
+
+async def _api_benchmark(requests: int, concurrency: int) -> dict:
+    import httpx
+
+    import history
+    import main
+    import store
+    from response_cache import EXCLUDED_PATHS
+
+    # history 경로도 잴 수 있도록 지금 스냅샷을 하루치 기록으로 남긴다.
+    history.record(time.strftime("%Y-%m-%d"), store.snapshots())
+
+    urls = _api_samples(store.get())
+    routes = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"Accept-Encoding": "gzip, br"}) as client:
+        for url in urls:
+            started = time.perf_counter()
+            response = await client.get(url)
+            first_ms = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}: {response.text[:200]}")
+
+            cached = await _bench_url(client, url, requests, concurrency)
+            # 응답 캐시 크기를 0으로 두면 매번 경로를 실행하고 직렬화·압축하므로 캐시가 없을 때의 비용을 잰다.
+            cache = _response_cache(main.app)
+            max_bytes, cache.max_bytes = cache.max_bytes, 0
+            cache.clear()
+            try:
+                uncached = await _bench_url(client, url, requests, concurrency)
+            finally:
+                cache.max_bytes = max_bytes
+
+            routes.append({"url": url, "bytes": len(response.content), "first_ms": first_ms,
+                           "cached": cached, "uncached": uncached})
+
+    # 샘플 URL이 하나도 맞지 않는 GET 경로는 새로 생겼는데 벤치마크에 빠진 것이다.
+    sampled = [url.split("?")[0] for url in urls]
+    not_benchmarked = sorted(route.path for route in main.app.routes
+                             if "GET" in getattr(route, "methods", ()) and route.path not in EXCLUDED_PATHS
+                             and not any(route.path_regex.match(path) for path in sampled))
+    return {"routes": routes, "not_benchmarked": not_benchmarked, "peak_rss_mb": _peak_rss_mb()}
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["crawl", "api", "all", "_crawl", "_api"])
+    parser.add_argument("--members", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429를 돌려줄 요청 비율")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--drift", type=float, default=0.1, help="하루 동안 문제를 더 푸는 멤버 비율 (warm 크롤링)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8, help="CRAWL_CONCURRENCY")
+    parser.add_argument("--rate-limit", type=float, default=0, help="CRAWL_RATE_LIMIT (0이면 무제한)")
+    parser.add_argument("--requests", type=int, default=200, help="API 경로마다 보낼 요청 수")
+    parser.add_argument("--api-concurrency", type=int, default=16)
+    parser.add_argument("--json", help="결과를 JSON으로 저장할 경로")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    if args.mode == "_crawl":
+        print(json.dumps(_crawl_worker()))
+        return
+    if args.mode == "_api":
+        print(json.dumps(asyncio.run(_api_benchmark(int(os.environ["BENCH_REQUESTS"]),
+                                                    int(os.environ["BENCH_CONCURRENCY"])))))
+        return
+
+    results = {}
+    if args.mode in ("crawl", "all"):
+        results["crawl"] = bench_crawl(args)
+    if args.mode in ("api", "all"):
+        results["api"] = bench_api(args)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
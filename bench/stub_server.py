@@ -0,0 +1,230 @@
+"""crawl.py가 쓰는 solved.ac API를 흉내 내는 로컬 서버.
+
+실제 solved.ac에 요청하지 않고 크롤링 성능을 재기 위한 것으로, 응답은 seed로 정해지는 합성 데이터다.
+멤버 수, 응답 지연, 429 비율을 조절할 수 있고, /_advance로 하루가 지나 일부 멤버가 문제를 더 푼 상태를 만든다.
+
+    python -m bench.stub_server --members 1000 --latency-ms 20 --error-rate 0.02 --port 8900
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+from functools import lru_cache
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+TARGET_ORGANIZATION_ID = 804
+TARGET_ORGANIZATION_NAME = "하나고등학교"
+FIRST_PROBLEM_ID = 1000
+LEVEL_COUNT = 31
+
+
+@dataclass
+class StubConfig:
+    members: int = 1000
+    organizations: int = 2000
+    problems: int = 30000
+    tags: int = 200
+    page_size: int = 50
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    retry_after: float = 1.0
+    drift: float = 0.1
+    seed: int = 0
+
+
+def create_app(config: StubConfig) -> Starlette:
+    rng = random.Random(config.seed)
+    state = {"day": 0, "requests": 0, "throttled": 0, "by_path": {}}
+
+    problems = {}
+    for problem_id in range(FIRST_PROBLEM_ID, FIRST_PROBLEM_ID + config.problems):
+        problems[problem_id] = {
+                "problemId": problem_id,
+                "titleKo"  : f"문제 {problem_id}",
+                "level"    : rng.randrange(LEVEL_COUNT),
+                "tags"     : [{"bojTagId": tag_id, "key": f"tag{tag_id}"}
+                              for tag_id in rng.sample(range(1, config.tags + 1), rng.randint(0, 3))],
+        }
+    problem_ids = list(problems)
+
+    tags = [{"bojTagId"    : tag_id,
+             "key"         : f"tag{tag_id}",
+             "problemCount": rng.randint(1, 2000),
+             "displayNames": [{"language": "ko", "name": f"태그{tag_id}"},
+                              {"language": "en", "name": f"tag{tag_id}"}]}
+            for tag_id in range(1, config.tags + 1)]
+    levels = [{"level": level, "count": rng.randint(100, 2000)} for level in range(LEVEL_COUNT)]
+
+    members = []
+    for i in range(config.members):
+        member_rng = random.Random(f"{config.seed}:member:{i}")
+        members.append({
+                "handle"         : f"user{i}",
+                "voteCount"      : member_rng.randint(0, 100),
+                "class"          : member_rng.randint(0, 10),
+                "classDecoration": "none",
+                "tier"           : member_rng.randrange(LEVEL_COUNT),
+                "rating"         : member_rng.randint(0, 3000),
+                "coins"          : 0,
+                "stardusts"      : member_rng.randint(0, 10000),
+                "rank"           : member_rng.randint(1, 200000),
+        })
+    members.sort(key=lambda member: -member["rating"])
+    member_index = {member["handle"]: member for member in members}
+
+    def roster(organization_id: int) -> list[dict]:
+        if organization_id == TARGET_ORGANIZATION_ID:
+            return members
+        # 다른 단체는 멤버 다섯 명 중 한 명씩을 겹치게 나눠 가진다 (여러 단체 크롤링용).
+        return members[-organization_id % 5::5]
+
+    organizations = []
+    for organization_id in range(1, config.organizations + 1):
+        if organization_id == TARGET_ORGANIZATION_ID:
+            name = TARGET_ORGANIZATION_NAME
+        else:
+            name = f"학교{organization_id}"
+        organizations.append({
+                "organizationId": organization_id,
+                "name"          : name,
+                "type"          : "high_school" if organization_id % 3 or name == TARGET_ORGANIZATION_NAME
+                                  else "university",
+                "rating"        : rng.randint(0, 5000),
+                "userCount"     : len(roster(organization_id)),
+                "voteCount"     : rng.randint(0, 1000),
+                "solvedCount"   : rng.randint(0, 50000),
+                "color"         : "#000000",
+        })
+    organizations.sort(key=lambda organization: (-organization["rating"], organization["organizationId"]))
+    for rank, organization in enumerate(organizations, start=1):
+        organization["rank"] = rank
+        organization["globalRank"] = rank
+
+    @lru_cache(maxsize=4096)
+    def solved(handle: str, day: int) -> tuple[int, ...]:
+        member_rng = random.Random(f"{config.seed}:solved:{handle}")
+        count = min(int(member_rng.paretovariate(1.2) * 30), len(problem_ids))
+        solved_ids = set(member_rng.sample(problem_ids, count))
+
+        # 하루가 지날 때마다 drift 비율의 멤버가 문제를 몇 개 더 푼다.
+        for past in range(1, day + 1):
+            day_rng = random.Random(f"{config.seed}:solved:{handle}:{past}")
+            if day_rng.random() < config.drift:
+                solved_ids.update(day_rng.sample(problem_ids, day_rng.randint(1, 5)))
+
+        return tuple(sorted(solved_ids))
+
+    def page(items: list, request: Request) -> dict:
+        number = int(request.query_params.get("page", 1))
+        start = (number - 1) * config.page_size
+        return {"count": len(items), "items": items[start:start + config.page_size]}
+
+    def conditional(request: Request, body) -> Response:
+        # 기준 데이터(태그, 레벨, 단체 랭킹)는 ETag를 붙이고 If-None-Match가 맞으면 304로 답한다.
+        content = json.dumps(body, ensure_ascii=False).encode()
+        etag = f'"{hashlib.blake2b(content, digest_size=8).hexdigest()}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content, media_type="application/json", headers={"ETag": etag})
+
+    def with_solved_count(member: dict) -> dict:
+        return {**member, "solvedCount": len(solved(member["handle"], state["day"]))}
+
+    async def throttle(request: Request) -> JSONResponse | None:
+        state["requests"] += 1
+        state["by_path"][request.url.path] = state["by_path"].get(request.url.path, 0) + 1
+
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        if config.error_rate and random.random() < config.error_rate:
+            state["throttled"] += 1
+            return JSONResponse({"message": "Too Many Requests"}, status_code=429,
+                                headers={"Retry-After": str(config.retry_after)})
+        return None
+
+    async def in_organization(request: Request):
+        if (response := await throttle(request)) is not None:
+            return response
+        body = page(roster(int(request.query_params["organizationId"])), request)
+        body["items"] = [with_solved_count(member) for member in body["items"]]
+        return JSONResponse(body)
+
+    async def organization_ranking(request: Request):
+        if (response := await throttle(request)) is not None:
+            return response
+        items = organizations
+        if "type" in request.query_params:
+            items = [organization for organization in items if organization["type"] == request.query_params["type"]]
+        return conditional(request, page(items, request))
+
+    async def search_problem(request: Request):
+        if (response := await throttle(request)) is not None:
+            return response
+        query = request.query_params.get("query", "")
+        handle = query[2:] if query.startswith("s@") else None
+        solved_ids = solved(handle, state["day"]) if handle in member_index else ()
+        return JSONResponse(page([problems[problem_id] for problem_id in solved_ids], request))
+
+    async def tag_list(request: Request):
+        if (response := await throttle(request)) is not None:
+            return response
+        return conditional(request, page(tags, request))
+
+    async def problem_level(request: Request):
+        if (response := await throttle(request)) is not None:
+            return response
+        return conditional(request, levels)
+
+    async def user_show(request: Request):
+        if (response := await throttle(request)) is not None:
+            return response
+        member = member_index.get(request.query_params.get("handle"))
+        if member is None:
+            return JSONResponse({"message": "Not Found"}, status_code=404)
+        return JSONResponse(with_solved_count(member))
+
+    async def stats(request: Request):
+        return JSONResponse({key: state[key] for key in ("day", "requests", "throttled", "by_path")})
+
+    async def advance(request: Request):
+        state["day"] += 1
+        return JSONResponse({"day": state["day"]})
+
+    return Starlette(routes=[
+            Route("/api/v3/ranking/in_organization", in_organization),
+            Route("/api/v3/ranking/organization", organization_ranking),
+            Route("/api/v3/search/problem", search_problem),
+            Route("/api/v3/tag/list", tag_list),
+            Route("/api/v3/problem/level", problem_level),
+            Route("/api/v3/user/show", user_show),
+            Route("/_stats", stats),
+            Route("/_advance", advance, methods=["GET", "POST"]),
+    ])
+
+
+def parse_args(argv: list[str] | None = None) -> tuple[StubConfig, argparse.Namespace]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    defaults = StubConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args(argv)
+    config = StubConfig(**{name: getattr(args, name) for name in vars(defaults)})
+    return config, args
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    stub_config, stub_args = parse_args()
+    uvicorn.run(create_app(stub_config), host=stub_args.host, port=stub_args.port, log_level="warning")
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import storage
+
+CHECKPOINT_DIR = os.path.join("cache", "checkpoint")
+
+# 1이면 실패한 이전 크롤링의 체크포인트가 남아 있을 때 이어서 크롤링한다.
+CRAWL_RESUME = os.environ.get("CRAWL_RESUME", "1") == "1"
+
+# 이보다 오래된 체크포인트는 데이터가 너무 낡았다고 보고 버린다.
+CHECKPOINT_MAX_AGE = timedelta(hours=float(os.environ.get("CRAWL_CHECKPOINT_MAX_AGE_HOURS", 12)))
+
+# 진행 중인 단계(멤버별 푼 문제)의 체크포인트를 최소 몇 초 간격으로 쓸지
+CHECKPOINT_INTERVAL = float(os.environ.get("CRAWL_CHECKPOINT_INTERVAL", 10))
+
+
+class Checkpoint:
+    """크롤링 단계별 결과를 디스크에 남겨, 실패한 크롤링을 마지막으로 끝난 작업부터 다시 시작할 수 있게 한다.
+
+    단계마다 directory/<name>.json 하나를 쓰고, 크롤링이 성공하면 clear()로 디렉터리를 지운다.
+    """
+
+    def __init__(self, directory: str = CHECKPOINT_DIR, resume: bool = CRAWL_RESUME):
+        self.directory = directory
+        self.resumed = resume and self._is_resumable()
+        self._saved_at: dict[str, float] = {}
+
+        if not self.resumed:
+            self.clear()
+            self.save("manifest", {"started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+
+    def _is_resumable(self) -> bool:
+        try:
+            manifest = self.load("manifest")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        started_at = datetime.strptime(manifest["started_at"], "%Y-%m-%d %H:%M:%S")
+        return started_at >= datetime.now() - CHECKPOINT_MAX_AGE
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def has(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def load(self, name: str):
+        with open(self.path(name), 'r') as f:
+            return json.load(f)
+
+    def save(self, name: str, data) -> None:
+        # 쓰는 도중 죽어도 이전 체크포인트가 남는다.
+        with storage.atomic_path(self.path(name)) as tmp, open(tmp, 'w') as f:
+            json.dump(data, f, ensure_ascii=False)
+        self._saved_at[name] = time.monotonic()
+
+    def due(self, name: str) -> bool:
+        """name을 마지막으로 저장한 지 CHECKPOINT_INTERVAL초가 지났는지."""
+        return time.monotonic() - self._saved_at.get(name, 0.0) >= CHECKPOINT_INTERVAL
+
+    def mark_saved(self, name: str) -> None:
+        self._saved_at[name] = time.monotonic()
+
+    async def stage(self, name: str, fetch, encode=lambda value: value, decode=lambda value: value):
+        """이어서 크롤링 중이고 name 단계가 이미 끝나 있으면 저장된 결과를, 아니면 fetch()의 결과를 저장해 반환한다."""
+        if self.resumed and self.has(name):
+            return decode(self.load(name))
+
+        value = await fetch()
+        self.save(name, encode(value))
+        return value
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable
+
+import httpx
+
+import metrics
+
+# 벤치마크처럼 solved.ac 대신 로컬 서버에 붙을 때 바꾼다.
+BASE_URL = os.environ.get("SOLVEDAC_BASE_URL", "https://solved.ac/api/v3")
+
+# 동시에 보낼 수 있는 최대 요청 수 (keep-alive 연결 풀 크기와 같음)
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", 8))
+
+# 초당 요청 수 상한과 순간적으로 몰아 보낼 수 있는 요청 수. 0이면 제한하지 않는다.
+CRAWL_RATE_LIMIT = float(os.environ.get("CRAWL_RATE_LIMIT", 10))
+CRAWL_BURST = int(os.environ.get("CRAWL_BURST", CRAWL_CONCURRENCY))
+
+# 요청 하나당 재시도 횟수와 지수 백오프의 기준/최대 대기 시간(초)
+CRAWL_MAX_RETRIES = int(os.environ.get("CRAWL_MAX_RETRIES", 5))
+CRAWL_BACKOFF_BASE = float(os.environ.get("CRAWL_BACKOFF_BASE", 1))
+CRAWL_BACKOFF_MAX = float(os.environ.get("CRAWL_BACKOFF_MAX", 60))
+
+# 크롤링 한 번에 보낼 수 있는 최대 요청 수. 0이면 무제한
+CRAWL_REQUEST_BUDGET = int(os.environ.get("CRAWL_REQUEST_BUDGET", 0))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SolvedacError(Exception):
+    """재시도를 모두 소진했거나 solved.ac가 예상하지 못한 응답을 준 경우."""
+
+
+class RequestBudgetExceeded(SolvedacError):
+    """크롤링 한 번에 허용된 요청 수를 넘긴 경우."""
+
+
+class TokenBucket:
+    """초당 rate개씩 토큰이 차는 토큰 버킷. 429를 받으면 block_for()로 모든 요청을 함께 멈춘다."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def block_for(self, seconds: float) -> None:
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                if self.rate <= 0:
+                    return
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After 헤더(초 또는 HTTP-date)를 대기 시간(초)으로 바꾼다."""
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class SolvedacClient:
+    """solved.ac API용 비동기 클라이언트.
+
+    하나의 keep-alive 연결 풀을 공유하고, 세마포어로 동시 요청 수를, 토큰 버킷으로 초당 요청 수를 제한한다.
+    실패한 요청은 크롤링 전체가 아니라 그 요청만 지터가 섞인 지수 백오프(429면 Retry-After)로 다시 보낸다.
+    """
+
+    def __init__(self, concurrency: int = CRAWL_CONCURRENCY, base_url: str = BASE_URL,
+                 rate_limit: float = CRAWL_RATE_LIMIT, burst: int = CRAWL_BURST,
+                 max_retries: int = CRAWL_MAX_RETRIES, request_budget: int = CRAWL_REQUEST_BUDGET):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.request_budget = request_budget
+        self.request_count = 0
+        self.retry_count = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rate_limit, burst)
+        self._client = httpx.AsyncClient(
+                base_url=base_url,
+                headers={"Accept": "application/json"},
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+                timeout=httpx.Timeout(30.0),
+        )
+
+    async def __aenter__(self) -> "SolvedacClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter: 여러 요청이 같은 순간에 한꺼번에 재시도하지 않도록 0 ~ 상한 사이에서 고른다.
+        return random.uniform(0, min(CRAWL_BACKOFF_MAX, CRAWL_BACKOFF_BASE * 2 ** attempt))
+
+    async def get(self, path: str, params: dict | None = None, headers: dict | None = None) -> httpx.Response:
+        """GET 요청을 보낸다. 재시도할 수 없는 응답(4xx 등)은 그대로 돌려주고, 재시도를 다 쓰면 SolvedacError."""
+        for attempt in range(self.max_retries + 1):
+            if self.request_budget and self.request_count >= self.request_budget:
+                raise RequestBudgetExceeded(f"request budget of {self.request_budget} exhausted at {path}")
+
+            await self._bucket.acquire()
+            self.request_count += 1
+
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await self._client.get(path, params=params, headers=headers)
+                except httpx.TransportError as e:
+                    metrics.record_upstream(path, "error", time.perf_counter() - started)
+                    error = f"{type(e).__name__}: {e}"
+                    reason = type(e).__name__
+                    delay = self._backoff(attempt)
+                else:
+                    metrics.record_upstream(path, response.status_code, time.perf_counter() - started,
+                                            response.num_bytes_downloaded)
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        return response
+
+                    error = f"HTTP {response.status_code}"
+                    reason = str(response.status_code)
+                    delay = parse_retry_after(response.headers.get("Retry-After"))
+                    if delay is None:
+                        delay = self._backoff(attempt)
+                    if response.status_code == 429:
+                        self._bucket.block_for(delay)
+
+            if attempt < self.max_retries:
+                self.retry_count += 1
+                metrics.UPSTREAM_RETRIES.inc(endpoint=path, reason=reason)
+                await asyncio.sleep(delay)
+
+        raise SolvedacError(f"GET {path} {params} failed after {self.max_retries + 1} attempts ({error})")
+
+    async def get_json(self, path: str, params: dict | None = None):
+        response = await self.get(path, params)
+        if response.status_code != 200:
+            raise SolvedacError(f"GET {path} {params} returned HTTP {response.status_code}")
+        return response.json()
+
+    async def get_all_pages(self, path: str, params: dict | None = None) -> list[dict]:
+        """첫 페이지의 count로 전체 페이지 수를 구한 뒤 나머지 페이지를 동시에 가져온다.
+
+        첫 페이지를 포함해 어느 페이지든 200이 아니면 SolvedacError. 빈 목록을 돌려주면 멤버가 모두 떠난 것처럼
+        집계가 조용히 틀어지기 때문이다.
+        """
+        params = dict(params or {})
+
+        first = await self.get_json(path, {**params, "page": 1})
+        items = list(first['items'])
+        if not items or first['count'] <= len(items):
+            return items
+
+        page_count = math.ceil(first['count'] / len(items))
+        bodies = await asyncio.gather(*(self.get_json(path, {**params, "page": page})
+                                        for page in range(2, page_count + 1)))
+        for body in bodies:
+            items.extend(body['items'])
+
+        return items
+
+    async def iter_pages(self, path: str, params: dict | None = None,
+                         transform: Callable[[list[dict]], list] = lambda items: items,
+                         window: int | None = None) -> AsyncIterator[list]:
+        """get_all_pages와 같이 받되, 페이지를 받는 대로 transform(items)를 하나씩 내준다. 순서는 보장하지 않는다.
+
+        transform은 응답을 받자마자 적용하므로, 아직 내주지 않은 페이지도 transform 결과만 메모리에 남는다.
+        동시에 받는 페이지는 window개(기본값은 concurrency)까지이고, 받는 쪽이 멈추면 새 페이지를 요청하지 않는다.
+        """
+        params = dict(params or {})
+        window = window or self.concurrency
+
+        first = await self.get_json(path, {**params, "page": 1})
+        count, page_size = first['count'], len(first['items'])
+        yield transform(first['items'])
+        del first
+        if not page_size or count <= page_size:
+            return
+
+        async def fetch(page: int) -> list:
+            return transform((await self.get_json(path, {**params, "page": page}))['items'])
+
+        pages = iter(range(2, math.ceil(count / page_size) + 1))
+        # 다 받은 페이지는 내주는 즉시 놓아야 하므로, 받는 중(pending)과 아직 내주지 않은(done) 것만 들고 있는다.
+        pending: set[asyncio.Future] = set()
+        done: set[asyncio.Future] = set()
+        try:
+            while True:
+                for page in itertools.islice(pages, window - len(pending)):
+                    pending.add(asyncio.ensure_future(fetch(page)))
+                if not pending:
+                    return
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                while done:
+                    yield done.pop().result()
+        finally:
+            # 받는 쪽이 중간에 멈추거나 한 페이지가 실패하면 남은 요청을 취소한다.
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if not task.cancelled():
+                    task.exception()  # 같이 실패한 페이지의 예외를 읽어 둬야 경고가 남지 않는다.
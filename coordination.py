@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import storage
+
+try:
+    import fcntl
+except ImportError:  # fcntl이 없는 플랫폼(Windows)에서는 프로세스 하나로만 띄운다고 보고 프로세스 안에서만 잠근다.
+    fcntl = None
+
+# 여러 worker(uvicorn --workers, gunicorn)가 같은 디렉터리를 쓸 때 서로를 조율하는 파일들.
+#   crawl.lock       : 크롤링 중인 프로세스가 잡고 있다. 못 잡은 worker는 크롤링을 건너뛴다.
+#   snapshot.lock    : 크롤링 결과/history를 쓰는 동안은 배타적으로, worker가 읽어 들이는 동안은 공유로 잡는다.
+#   snapshot.version : 새 스냅샷을 다 쓰고 history까지 남긴 뒤 바꾼다. worker는 이 값이 바뀌면 다시 읽어 들인다.
+COORDINATION_DIR = "cache"
+CRAWL_LOCK_PATH = os.path.join(COORDINATION_DIR, "crawl.lock")
+SNAPSHOT_LOCK_PATH = os.path.join(COORDINATION_DIR, "snapshot.lock")
+SNAPSHOT_VERSION_PATH = os.path.join(COORDINATION_DIR, "snapshot.version")
+
+# worker가 snapshot.version을 확인하는 간격(초)
+SNAPSHOT_POLL_SECONDS = float(os.environ.get("SNAPSHOT_POLL_SECONDS", 5))
+
+# fcntl이 없을 때 쓰는 경로별 프로세스 안 잠금. FileLock은 잡을 때마다 새로 만들므로 경로로 같은 잠금을 찾는다.
+_fallback_locks: dict[str, threading.Lock] = {}
+_fallback_locks_guard = threading.Lock()
+
+
+def _fallback_lock(path: str) -> threading.Lock:
+    with _fallback_locks_guard:
+        return _fallback_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class FileLock:
+    """flock(2) 기반 잠금. 잡은 프로세스가 죽으면 커널이 풀어 주므로 남은 잠금 파일을 치울 필요가 없다.
+
+    flock은 파일을 연 단위로 걸리므로 같은 프로세스의 다른 스레드끼리도 서로 막는다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fallback = _fallback_lock(path)
+        self._file = None
+
+    def acquire(self, shared: bool = False, blocking: bool = True) -> bool:
+        if fcntl is None:
+            return self._fallback.acquire(blocking=blocking)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, 'a')
+        flags = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self) -> None:
+        if fcntl is None:
+            self._fallback.release()
+            return
+
+        f, self._file = self._file, None
+        fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+@contextmanager
+def _locked(path: str, shared: bool):
+    lock = FileLock(path)
+    lock.acquire(shared=shared)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def writing_snapshot():
+    """크롤링 결과나 history를 쓰는 동안. 읽어 들이는 worker가 반쯤 쓴 파일을 섞어 읽지 않게 한다."""
+    return _locked(SNAPSHOT_LOCK_PATH, shared=False)
+
+
+def reading_snapshot():
+    return _locked(SNAPSHOT_LOCK_PATH, shared=True)
+
+
+def read_version() -> str | None:
+    try:
+        with open(SNAPSHOT_VERSION_PATH, 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_version() -> str:
+    """새 스냅샷을 다 쓴 뒤 부른다. 다른 worker는 SNAPSHOT_POLL_SECONDS 안에 바뀐 값을 보고 다시 읽어 들인다."""
+    version = str(time.time_ns())
+    storage.atomic_write(SNAPSHOT_VERSION_PATH, version)
+    return version
@@ -1,52 +1,115 @@
 from typing import Dict
 
-import requests
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import bs4 as bs
+import numpy as np
 import pandas as pd
 import json
 from io import StringIO  # StringIO를 추가합니다.
 from datetime import datetime, timedelta
 
+import coordination
+import metrics
+import reference_cache
+import storage
+from checkpoint import CRAWL_RESUME, Checkpoint
+from client import CRAWL_CONCURRENCY, SolvedacClient
+from matrix import LEVEL_COUNT, SolveMatrix
+
+logger = logging.getLogger(__name__)
+
+# 1이면 solved_count가 바뀐 멤버의 푼 문제만 다시 가져온다.
+CRAWL_INCREMENTAL = os.environ.get("CRAWL_INCREMENTAL", "1") == "1"
+
+SOLVED_CACHE_PATH = os.path.join("cache", "solved_problems.json")
+
+ORGANIZATION_DIRECTORY_PATH = os.path.join("cache", "organizations.json")
+
+# 멤버별 푼 문제를 받는 쪽과 캐시에 반영하는 쪽 사이에 쌓아 둘 수 있는 최대 페이지 수.
+# 가득 차면 받는 쪽이 기다리므로, 받는 중인 페이지는 이 크기 + worker 수 x 멤버당 동시에 받는 페이지 수
+# (둘 다 CRAWL_CONCURRENCY)로 묶인다. 푼 문제 캐시 자체는 멤버 수에 비례한다.
+CRAWL_QUEUE_SIZE = int(os.environ.get("CRAWL_QUEUE_SIZE", 64))
+
+# 한 번에 크롤링할 단체 이름 목록(쉼표로 구분). 첫 번째 단체가 API의 기본 단체다.
+ORGANIZATIONS = [name.strip() for name in os.environ.get("ORGANIZATIONS", "하나고등학교").split(",") if name.strip()]
+
+
+async def get_organization_roster(client: SolvedacClient, organization_id: int = 804) -> list[dict]:
+    """조직 내 랭킹 전체. 첫 페이지의 count로 나머지 페이지를 동시에 받는다."""
+    items = await client.get_all_pages("/ranking/in_organization", {"organizationId": organization_id})
+
+    # 페이지를 받는 사이 순위가 바뀌면 같은 멤버가 두 페이지에 걸쳐 나올 수 있으므로 먼저 나온 것만 남긴다.
+    seen = set()
+    roster = []
+    for item in items:
+        if item['handle'] not in seen:
+            seen.add(item['handle'])
+            roster.append(item)
+
+    return roster
+
+
+async def get_organization_directory(client: SolvedacClient) -> dict[str, dict]:
+    """전체 단체 랭킹을 한 번 훑어 이름 -> 단체 정보 색인을 만든다.
+
+    type_rank는 같은 type(high_school 등) 안에서의 순위로, type별 랭킹을 따로 받지 않고 전체 순위에서 계산한다.
+    """
+    items = list(await reference_cache.get(client, "organizations", "/ranking/organization", paged=True))
+    items.sort(key=lambda item: item['rank'])
+
+    directory: dict[str, dict] = {}
+    seen_by_type: dict[str, int] = {}
+    last_by_type: dict[str, tuple[int, int]] = {}  # type -> (마지막 전체 순위, 그 단체의 type_rank)
+    for item in items:
+        if item['name'] in directory:
+            continue
+
+        seen = seen_by_type.get(item['type'], 0)
+        last_rank, last_type_rank = last_by_type.get(item['type'], (None, None))
+        type_rank = last_type_rank if item['rank'] == last_rank else seen + 1
+        seen_by_type[item['type']] = seen + 1
+        last_by_type[item['type']] = (item['rank'], type_rank)
+
+        directory[item['name']] = {
+                'organization_id': item['organizationId'],
+                'name'           : item['name'],
+                'type'           : item['type'],
+                'rating'         : item['rating'],
+                'user_count'     : item['userCount'],
+                'vote_count'     : item['voteCount'],
+                'solved_count'   : item['solvedCount'],
+                'color'          : item['color'],
+                'rank'           : item['rank'],
+                'global_rank'    : item['globalRank'],
+                'type_rank'      : type_rank,
+        }
 
-def get_user_handle_list(organization_id: int = 804) -> list:
-    handle_list = []
-
-    url = f"https://solved.ac/api/v3/ranking/in_organization?page=1&organizationId={organization_id}"
-
-    headers = {"Accept": "application/json"}
-
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        for i in response.json()['items']:
-            handle_list.append(i['handle'])
-
-    return handle_list
+    return directory
 
 
-def get_organization_id(name: str) -> int:
-    url = "https://solved.ac/api/v3/ranking/organization"
+def load_organization_directory(path: str = ORGANIZATION_DIRECTORY_PATH) -> dict[str, dict]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
-    headers = {"Accept": "application/json"}
-    i = 1
-    while True:
-        querystring = {"page": str(i)}
 
-        response = requests.get(url, headers=headers, params=querystring)
-        if response.status_code == 200 and name in response.text:
-            break
-        if response.status_code != 200 or len(response.json()['items']) == 0:
-            break
-        i += 1
+def save_organization_directory(directory: dict[str, dict], path: str = ORGANIZATION_DIRECTORY_PATH) -> None:
+    with storage.atomic_path(path) as tmp, open(tmp, 'w') as f:
+        json.dump(directory, f, ensure_ascii=False)
 
-    for i in response.json()['items']:
-        if i['name'] == name:
-            return i['organizationId']
 
+def get_organization_ids(directory: dict[str, dict], names: list[str]) -> dict[str, int]:
+    """names 중 directory에 있는 단체의 이름 -> organization_id. 순서는 names를 따른다."""
+    return {name: directory[name]['organization_id'] for name in names if name in directory}
 
-def get_all_high_school_data():
-    url = "https://solved.ac/api/v3/ranking/organization"
 
+def get_all_high_school_data(directory: dict[str, dict]):
     hs_dict = {
             "organization_id": [],  # 439
             "name"           : [],  # "경기과학고등학교"
@@ -60,75 +123,43 @@ def get_all_high_school_data():
             "global_rank"    : [],  # 2
     }
 
-    headers = {"Accept": "application/json"}
-    i = 1
-    while True:
-        querystring = {"page": str(i), "type": "high_school"}
-
-        response = requests.get(url, headers=headers, params=querystring)
-        if response.status_code != 200 or len(response.json()['items']) == 0:
-            break
-
-        for item in response.json()['items']:
-            hs_dict['organization_id'].append(item['organizationId'])
-            hs_dict['name'].append(item['name'])
-            hs_dict['type'].append(item['type'])
-            hs_dict['rating'].append(item['rating'])
-            hs_dict['user_count'].append(item['userCount'])
-            hs_dict['vote_count'].append(item['voteCount'])
-            hs_dict['solved_count'].append(item['solvedCount'])
-            hs_dict['color'].append(item['color'])
-            hs_dict['rank'].append(item['rank'])
-            hs_dict['global_rank'].append(item['globalRank'])
-
-        i += 1
+    high_schools = [item for item in directory.values() if item['type'] == "high_school"]
+    for item in sorted(high_schools, key=lambda item: item['type_rank']):
+        hs_dict['organization_id'].append(item['organization_id'])
+        hs_dict['name'].append(item['name'])
+        hs_dict['type'].append(item['type'])
+        hs_dict['rating'].append(item['rating'])
+        hs_dict['user_count'].append(item['user_count'])
+        hs_dict['vote_count'].append(item['vote_count'])
+        hs_dict['solved_count'].append(item['solved_count'])
+        hs_dict['color'].append(item['color'])
+        hs_dict['rank'].append(item['type_rank'])
+        hs_dict['global_rank'].append(item['global_rank'])
 
     return pd.DataFrame(hs_dict, columns=['organization_id', 'name', 'type', 'rating', 'user_count', 'vote_count',
                                           'solved_count', 'color', 'rank', 'global_rank'])
 
 
-def get_organization_info(name: str = "하나고등학교") -> dict:
-    url = "https://solved.ac/api/v3/ranking/organization"
-
-    headers = {"Accept": "application/json"}
-    i = 1
-    while True:
-        querystring = {"page": str(i)}
-
-        response = requests.get(url, headers=headers, params=querystring)
-        if response.status_code == 200 and name in response.text:
-            break
-        i += 1
-
-    for i in response.json()['items']:
-        if i['name'] == name:
-            data = {
-                    'rank'        : i['rank'],
-                    'count'       : response.json()['count'],
-                    "user_count"  : i["userCount"],
-                    "solved_count": i["solvedCount"],
-                    "vote_count"  : i["voteCount"],
-                    "name"        : i["name"],
-                    "rating"      : i["rating"],
-            }
-
-    i = 1
-    while True:
-        querystring = {"page": str(i), "type": "high_school"}
-
-        response = requests.get(url, headers=headers, params=querystring)
-        if response.status_code == 200 and name in response.text:
-            break
-        i += 1
-
-    for i in response.json()['items']:
-        if i['name'] == name:
-            data['rank_high_school'] = i['rank']
+def get_organization_info(directory: dict[str, dict], name: str = "하나고등학교") -> dict:
+    i = directory[name]
+
+    data = {
+            'rank'        : i['rank'],
+            'count'       : len(directory),
+            "user_count"  : i["user_count"],
+            "solved_count": i["solved_count"],
+            "vote_count"  : i["vote_count"],
+            "name"        : i["name"],
+            "rating"      : i["rating"],
+    }
+
+    if i['type'] == "high_school":
+        data['rank_high_school'] = i['type_rank']
 
     return data
 
 
-def get_user_info(handle: str) -> dict | None:
+async def get_user_info(client: SolvedacClient, handle: str) -> dict | None:
     # url1 = f"https://www.acmicpc.net/user/{handle}" TODO: are you sure to crawl baekjoon?
     #
     # html = bs.BeautifulSoup(requests.get(url1, headers={'User-Agent': 'Mozilla/5.0'}).text, 'html.parser')
@@ -138,13 +169,7 @@ def get_user_info(handle: str) -> dict | None:
     # # 등수 요소에서 등수를 추출합니다.
     # rank = rank_element .find_next('td').text.strip()
 
-    url2 = "https://solved.ac/api/v3/user/show"
-
-    querystring = {"handle": handle}
-
-    headers = {"Accept": "application/json"}
-
-    response = requests.get(url2, headers=headers, params=querystring)
+    response = await client.get("/user/show", {"handle": handle})
 
     if response.status_code != 200:
         return {
@@ -177,12 +202,8 @@ def get_user_info(handle: str) -> dict | None:
     }
 
 
-def get_organiztion_user_data(organization_id: int = 804) -> pd.DataFrame:
-    url = f"https://solved.ac/api/v3/ranking/in_organization?page=1&organizationId={organization_id}"
-
-    headers = {"Accept": "application/json"}
-
-    response = requests.get(url, headers=headers)
+async def get_organiztion_user_data(client: SolvedacClient, organization_id: int = 804) -> pd.DataFrame:
+    roster = await get_organization_roster(client, organization_id)
 
     user_dict = {
             'handle'          : [],
@@ -197,8 +218,8 @@ def get_organiztion_user_data(organization_id: int = 804) -> pd.DataFrame:
             'solved_rank_all' : [],
     }
 
-    if response.status_code == 200:
-        for i in response.json()['items']:
+    if roster:
+        for i in roster:
             user_dict['handle'].append(i['handle'])
             user_dict['solved_count'].append(i['solvedCount'])
             user_dict['vote_count'].append(i['voteCount'])
@@ -226,171 +247,381 @@ def get_organiztion_user_data(organization_id: int = 804) -> pd.DataFrame:
     # solved_rank by rank
     df = df.sort_values(by='rating', ascending=False)
     df = df.reset_index(drop=True)
-    for i in range(len(df)):
-        if df.loc[i, 'rating'] is not None:
-            if i > 0 and df.loc[i, 'rating'] == df.loc[i - 1, 'rating']:
-                df.loc[i, 'solved_rank'] = df.loc[i - 1, 'solved_rank']
-            else:
-                df.loc[i, 'solved_rank'] = i + 1
+    # 같은 rating이면 같은 등수 (1, 2, 2, 4, ...)
+    df['solved_rank'] = df['rating'].rank(method='min', ascending=False).astype('Int64')
     return df
 
 
-def main() -> tuple[pd.DataFrame, dict]:
-    updated_at: datetime = datetime.now()
+def main(concurrency: int = CRAWL_CONCURRENCY, incremental: bool = CRAWL_INCREMENTAL,
+         resume: bool = CRAWL_RESUME, organizations: list[str] = ORGANIZATIONS) -> dict[str, tuple[pd.DataFrame, dict]]:
+    with metrics.track_crawl(organizations):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(crawl(concurrency, incremental, resume, organizations))
 
-    user_data = get_organiztion_user_data()
-    # print(user_data)
+        # uvicorn처럼 이벤트 루프 안에서 호출된 경우 별도 스레드에서 크롤링을 돌린다.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, crawl(concurrency, incremental, resume, organizations)).result()
 
-    organization_data = get_organization_info("하나고등학교")
-    # print(organization_data)
 
-    problem_by_level, problem_by_tag = get_organization_solved_problems_by_level_and_tag()
-    # print(problem_by_level)
-    # print(problem_by_tag)
+def _encode_frame(df: pd.DataFrame) -> dict:
+    split = df.to_dict(orient="split")
+    return {'columns': split['columns'], 'data': split['data']}
 
-    problem_info = get_solved_problem_info()
-    # print(problem_info)
 
-    high_school_data = get_all_high_school_data()
+def _decode_frame(data: dict) -> pd.DataFrame:
+    return pd.DataFrame(data['data'], columns=data['columns'])
 
-    user_data.to_csv(f'user_data.csv', index=False)
-    pd.DataFrame(organization_data, index=[0]).to_csv(f'organization_data.csv', index=False)
-    level_problem_count = get_solvedac_problem_level_count()
-    df = pd.DataFrame(columns=['level', 'count', 'solved_count'])
-    idx = 0
-    for level, problem_list in problem_by_level.items():
-        df = pd.concat([df, pd.DataFrame(
-                {'level': level, 'count': level_problem_count[level], 'solved_count': len(problem_list)},
-                index=[idx])])
-        idx += 1
-    df.to_csv(f'problem_count_by_level.csv', index=False)
 
-    df = pd.DataFrame(columns=['tag_id', 'ko', 'en', 'count', 'solved_count'])
-    idx = 0
-    for tag_id, tag_data in problem_by_tag.items():
-        df = pd.concat([df, pd.DataFrame({'tag_id'      : tag_id, 'ko': tag_data['ko'], 'en': tag_data['en'],
-                                          'count'       : tag_data['count'],
-                                          'solved_count': tag_data['solved_count']}, index=[idx])])
-        idx += 1
-    df.to_csv(f'problem_count_by_tag.csv', index=False)
+def _decode_int_keys(data: dict) -> dict:
+    return {int(key): value for key, value in data.items()}
 
-    with open("problem_info.json", 'w') as f:
-        json.dump(problem_info, f, ensure_ascii=False, indent=4)
 
-    high_school_data.to_csv(f'high_school_data.csv', index=False)
+async def crawl(concurrency: int = CRAWL_CONCURRENCY, incremental: bool = CRAWL_INCREMENTAL,
+                resume: bool = CRAWL_RESUME,
+                organizations: list[str] = ORGANIZATIONS) -> dict[str, tuple[pd.DataFrame, dict]]:
+    """organizations를 한 번에 크롤링한다.
 
-    with open('updated_at.txt', 'w') as f:
-        f.write(updated_at.strftime("%Y-%m-%d %H:%M:%S"))
+    태그 목록, 레벨별 문제 수, 단체 색인, 멤버별 푼 문제 캐시는 모든 단체가 함께 쓰므로 한 번씩만 받고,
+    여러 단체에 속한 멤버의 푼 문제도 한 번만 받는다. 단체별 결과는 organizations/<organization_id>/에 저장한다.
+    """
+    updated_at: datetime = datetime.now()
 
-    return user_data, organization_data
+    checkpoint = Checkpoint(resume=resume)
+    if checkpoint.resumed and checkpoint.has("solved_problems"):
+        logger.info("resuming the previous crawl from its checkpoint")
+        solved_cache = load_solved_cache(checkpoint.path("solved_problems"))
+    else:
+        solved_cache = load_solved_cache() if incremental else None
+
+    async with SolvedacClient(concurrency) as client:
+        directory_task = asyncio.ensure_future(metrics.timed(
+                "organizations", checkpoint.stage("organizations", lambda: get_organization_directory(client))))
+
+        async def crawl_members() -> tuple[dict[str, int], dict]:
+            # 이전 크롤링의 단체 색인에 모두 있으면 새 색인을 기다리지 않고 바로 멤버 목록을 받는다.
+            organization_ids = get_organization_ids(load_organization_directory(), organizations)
+            if len(organization_ids) < len(set(organizations)):
+                organization_ids = get_organization_ids(await directory_task, organizations)
+                for name in organizations:
+                    if name not in organization_ids:
+                        logger.warning(f"organization not found: {name}")
+            if not organization_ids:
+                raise ValueError(f"organizations not found: {organizations}")
+
+            snapshot = await get_crawl_snapshot(client, list(organization_ids.values()), solved_cache, checkpoint)
+            return organization_ids, snapshot
+
+        # 한 단계가 실패해도 나머지 단계는 끝까지 돌려 체크포인트를 남긴 뒤, 첫 번째 예외를 올린다.
+        results = await asyncio.gather(
+                crawl_members(),
+                directory_task,
+                metrics.timed("tags", checkpoint.stage("tags", lambda: get_solvedac_tag_dict(client),
+                                                       decode=_decode_int_keys)),
+                metrics.timed("levels", checkpoint.stage("levels", lambda: get_solvedac_problem_level_count(client),
+                                                         decode=_decode_int_keys)),
+                return_exceptions=True,
+        )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    (organization_ids, snapshot), directory, tag_data, level_problem_count = results
+
+    # 이전 크롤링의 색인으로 멤버 목록을 받은 단체가 그사이 이름이 바뀌었거나 목록에서 빠졌으면 건너뛴다.
+    for name in [name for name in organization_ids if name not in directory]:
+        logger.warning(f"organization not found: {name}")
+        del organization_ids[name]
+    if not organization_ids:
+        raise ValueError(f"organizations not found: {organizations}")
+
+    # 다른 worker가 스냅샷을 읽어 들이는 중에는 쓰지 않고, 쓰는 동안에는 읽어 들이지 못하게 한다.
+    with coordination.writing_snapshot():
+        crawled = {}
+        for name, organization_id in organization_ids.items():
+            user_data = snapshot['user_data'][organization_id]
+            with metrics.stage("aggregate"):
+                organization_data = get_organization_info(directory, name)
+                matrix = get_solve_matrix(snapshot['solved_cache'], user_data)
+                problem_info = get_solved_problem_info(matrix, user_data)
+                problem_count_by_level = get_problem_count_by_level(matrix, level_problem_count)
+                problem_count_by_tag = get_problem_count_by_tag(matrix, tag_data)
+
+            with metrics.stage("write"):
+                output_dir = storage.organization_dir(organization_id)
+                storage.save_frame(user_data, 'user_data', output_dir)
+                storage.save_frame(pd.DataFrame(organization_data, index=[0]), 'organization_data', output_dir)
+                storage.save_frame(problem_count_by_level, 'problem_count_by_level', output_dir)
+                storage.save_frame(problem_count_by_tag, 'problem_count_by_tag', output_dir)
+
+                storage.save_problem_info(problem_info, directory=output_dir)
+
+            crawled[name] = (user_data, organization_data)
+
+        with metrics.stage("high_schools"):
+            high_school_data = get_all_high_school_data(directory)
+
+        with metrics.stage("write"):
+            storage.save_frame(high_school_data, 'high_school_data')
+
+            save_solved_cache(snapshot['solved_cache'])
+            save_organization_directory(directory)
+
+            # 모든 단체의 파일을 다 쓴 뒤에 목록을 바꿔야 서버가 반쯤 쓴 단체를 읽지 않는다.
+            storage.save_organization_index([{'organization_id': organization_id, 'name': name}
+                                             for name, organization_id in organization_ids.items()])
+
+            with open('updated_at.txt', 'w') as f:
+                f.write(updated_at.strftime("%Y-%m-%d %H:%M:%S"))
+
+    checkpoint.clear()
+
+    return crawled
+
+
+def compact_problems(items: list[dict]) -> list[tuple[int, int, list[int]]]:
+    """검색 결과 한 페이지에서 집계에 쓰는 (문제 번호, 레벨, 태그 id 목록)만 남긴다. 제목 등 나머지는 바로 버린다."""
+    return [(item['problemId'], item['level'], sorted({tag['bojTagId'] for tag in item['tags']})) for item in items]
+
+
+def iter_user_solved_problem_pages(client: SolvedacClient, handle: str):
+    return client.iter_pages("/search/problem", {"query": f"s@{handle}", "sort": "id"}, transform=compact_problems)
+
+
+def load_solved_cache(path: str = SOLVED_CACHE_PATH) -> dict:
+    """이전 크롤링에서 저장한 멤버별 푼 문제 캐시를 읽는다. 없으면 빈 캐시를 반환한다.
+
+    members  : handle -> {'solved_count': 캐시 시점의 푼 문제 수, 'problems': [문제 번호]}
+    problems : 문제 번호 -> {'level': 레벨, 'tags': [bojTagId]}
+    solvers  : 문제 번호 -> 그 문제를 푼 handle 집합
+
+    members만 믿을 수 있는 원본이다. 체크포인트는 멤버를 받는 도중에도 저장되므로, solvers는 members로 다시 만들고
+    아무도 풀지 않은 problems는 버린다.
+    """
+    try:
+        with open(path, 'r') as f:
+            raw = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'members': {}, 'problems': {}, 'solvers': {}}
+
+    solvers: dict[int, set[str]] = {}
+    for handle, member in raw['members'].items():
+        for problem_id in member['problems']:
+            solvers.setdefault(problem_id, set()).add(handle)
 
+    return {
+            'members' : raw['members'],
+            'problems': {int(problem_id): value for problem_id, value in raw['problems'].items()
+                         if int(problem_id) in solvers},
+            'solvers' : solvers,
+    }
 
-def get_user_solved_problem_list(handle: str):
-    url = "https://solved.ac/api/v3/search/problem"
 
-    querystring = {"query": f"s@{handle}", "sort": "id"}
+def save_solved_cache(cache: dict, path: str = SOLVED_CACHE_PATH) -> None:
+    with storage.atomic_path(path) as tmp, open(tmp, 'w') as f:
+        json.dump({'members': cache['members'], 'problems': cache['problems']}, f, ensure_ascii=False)
 
-    headers = {"Accept": "application/json"}
 
-    i = 1
+def _drop_solver(cache: dict, problem_id: int, handle: str) -> None:
+    cache['solvers'][problem_id].discard(handle)
+    if not cache['solvers'][problem_id]:
+        del cache['solvers'][problem_id]
+        del cache['problems'][problem_id]
 
-    problem_list = []
 
-    while True:
-        querystring["page"] = i
+def add_solved_page(cache: dict, handle: str, problems: list[tuple[int, int, list[int]]], seen: set[int]) -> None:
+    """받은 페이지 하나를 바로 problems/solvers에 반영하고, 문제 번호만 seen에 모은다.
 
-        response = requests.get(url, headers=headers, params=querystring)
+    problems는 compact_problems()의 (문제 번호, 레벨, 태그 id 목록)이다. 멤버의 목록은 apply_solved_delta()로
+    마지막 페이지까지 받은 뒤에 바꾸고, 중간에 실패하면 discard_solved_pages()로 되돌린다.
+    """
+    for problem_id, level, tags in problems:
+        cache['problems'][problem_id] = {'level': level, 'tags': tags}
+        cache['solvers'].setdefault(problem_id, set()).add(handle)
+        seen.add(problem_id)
 
-        # is empty
-        if response.status_code != 200 or not response.json()['items']:
-            break
 
-        problem_list.extend(response.json()['items'])
+def discard_solved_pages(cache: dict, handle: str, seen: set[int]) -> None:
+    """받다가 실패한 멤버가 add_solved_page()로 새로 더한 문제를 되돌린다. 캐시의 멤버 목록은 그대로 둔다."""
+    old_problems = set(cache['members'].get(handle, {}).get('problems', []))
+    for problem_id in seen - old_problems:
+        _drop_solver(cache, problem_id, handle)
 
-        i += 1
 
-    return problem_list
+def apply_solved_delta(cache: dict, handle: str, solved_count: int | None, seen: set[int] | None) -> None:
+    """handle의 푼 문제 목록을 seen으로 교체하고, 더 이상 풀지 않은 문제에서만 solvers를 지운다.
 
+    seen은 add_solved_page()로 모은 문제 번호다. None이면 조직을 떠난 멤버로 보고 캐시에서 지운다.
+    solved_count가 None이면 다음 크롤링에서 이 멤버를 다시 받는다.
+    """
+    old_problems = set(cache['members'].get(handle, {}).get('problems', []))
 
-def get_organization_solved_problems_by_level_and_tag(name: str = "하나고등학교"):
-    level_problems: dict[int, set[int] | list[int]] = {i: [] for i in range(31)}
+    if seen is None:
+        seen = set()
+        cache['members'].pop(handle, None)
+    else:
+        cache['members'][handle] = {'solved_count': solved_count, 'problems': sorted(seen)}
+
+    for problem_id in old_problems - seen:
+        _drop_solver(cache, problem_id, handle)
+
+
+async def get_crawl_snapshot(client: SolvedacClient, organization_ids: list[int], cache: dict | None = None,
+                             checkpoint: Checkpoint | None = None) -> dict:
+    """단체들의 멤버 목록과, 멤버별로 푼 문제 목록을 한 번씩만 가져온다.
+
+    cache가 주어지면 solved_count가 캐시와 같은 멤버는 다시 가져오지 않고, 바뀐 멤버만 새로 받아
+    캐시에 차이를 반영한다. 여러 단체에 속한 멤버도 한 번만 받으며, 어느 단체에도 없는 멤버는 캐시에서 지운다.
+    레벨/태그별 문제 수와 problem_info는 모두 이 스냅샷에서 계산한다.
+    checkpoint가 주어지면 단체별 멤버 목록과, 멤버별 결과를 반영한 캐시를 주기적으로 저장한다.
+    """
+    if cache is None:
+        cache = {'members': {}, 'problems': {}, 'solvers': {}}
+
+    async def fetch_roster(organization_id: int) -> pd.DataFrame:
+        if checkpoint is None:
+            return await get_organiztion_user_data(client, organization_id)
+        return await checkpoint.stage(f"roster_{organization_id}",
+                                      lambda: get_organiztion_user_data(client, organization_id),
+                                      encode=_encode_frame, decode=_decode_frame)
+
+    with metrics.stage("roster"):
+        rosters = await asyncio.gather(*(fetch_roster(organization_id) for organization_id in organization_ids),
+                                       return_exceptions=True)
+    for roster in rosters:
+        if isinstance(roster, BaseException):
+            raise roster
+    user_data = dict(zip(organization_ids, rosters))
+
+    solved_counts: dict[str, int] = {}
+    for roster in rosters:
+        solved_counts.update(zip(roster['handle'].tolist(), roster['solved_count'].tolist()))
+
+    for handle in list(cache['members']):
+        if handle not in solved_counts:
+            apply_solved_delta(cache, handle, None, None)
+
+    # 검색 결과는 문제 번호순이라 새로 푼 문제가 어느 페이지에 끼어들지 알 수 없으므로, 바뀐 멤버는 전부 다시 받는다.
+    # 이어서 크롤링하는 경우 이미 받은 멤버는 캐시의 solved_count가 같으므로 자연히 건너뛴다.
+    stale_handles = [handle for handle, solved_count in solved_counts.items()
+                     if cache['members'].get(handle, {}).get('solved_count') != solved_count]
+
+    # 받는 쪽(멤버 하나씩 맡는 worker들)과 캐시에 반영하는 쪽을 크기가 정해진 큐로 잇는다. 페이지는 받자마자
+    # compact_problems()로 줄이고, 큐에서 꺼내는 대로 problems/solvers에 반영한 뒤 버린다. 멤버별로는 문제 번호
+    # 집합만 남겨 두었다가, 마지막 페이지까지 받으면 멤버의 목록을 바꾼다.
+    # 큐에는 (handle, 페이지) 또는 멤버가 끝났다는 (handle, None), 실패했다는 (handle, 예외)가 들어간다.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=CRAWL_QUEUE_SIZE)
+    pending_handles = iter(stale_handles)
+
+    async def fetch_solved():
+        for handle in pending_handles:
+            try:
+                async for page in iter_user_solved_problem_pages(client, handle):
+                    await queue.put((handle, page))
+            except Exception as e:
+                await queue.put((handle, e))
+            else:
+                await queue.put((handle, None))
+
+    # 한 멤버가 실패해도 나머지 멤버는 끝까지 받아 체크포인트에 남기고, 마지막에 첫 번째 예외를 올린다.
+    error: Exception | None = None
+    with metrics.stage("solved"):
+        workers = [asyncio.ensure_future(fetch_solved()) for _ in range(min(client.concurrency, len(stale_handles)))]
+        try:
+            received: dict[str, set[int]] = {}
+            finished = 0
+            while finished < len(stale_handles):
+                handle, page = await queue.get()
+                if isinstance(page, Exception):
+                    error = error or page
+                    discard_solved_pages(cache, handle, received.pop(handle, set()))
+                    finished += 1
+                    continue
+                if page is not None:
+                    add_solved_page(cache, handle, page, received.setdefault(handle, set()))
+                    continue
+
+                # 받은 문제 수가 solved_count와 다르면(검색이 비었거나 그사이 더 풀었으면) 이번 집계에는 쓰되,
+                # 캐시에는 solved_count를 비워 두어 다음 크롤링에서 다시 받게 한다.
+                seen = received.pop(handle, set())
+                solved_count = solved_counts[handle]
+                if len(seen) != solved_count:
+                    logger.warning(f"{handle}: received {len(seen)} of {solved_count} solved problems")
+                    solved_count = None
+                apply_solved_delta(cache, handle, solved_count, seen)
+                finished += 1
+
+                if checkpoint is not None and checkpoint.due("solved_problems"):
+                    save_solved_cache(cache, checkpoint.path("solved_problems"))
+                    checkpoint.mark_saved("solved_problems")
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    if checkpoint is not None:
+        save_solved_cache(cache, checkpoint.path("solved_problems"))
+    if error is not None:
+        raise error
 
-    tag_data = get_solvedac_tag_dict()
-    tag_problems: dict[int, list[int]] = {i: [] for i in range(max(tag_data.keys()) + 1)}
+    return {
+            'user_data'   : user_data,
+            'solved_cache': cache,
+    }
 
-    for handle in get_user_handle_list(get_organization_id(name)):  # Delete when deploy
-        problems = get_user_solved_problem_list(handle)
 
-        for problem in problems:
-            level_problems[problem['level']].append(problem['problemId'])
+def get_solve_matrix(cache: dict, user_data: pd.DataFrame) -> SolveMatrix:
+    return SolveMatrix.from_solved_cache(cache, user_data['handle'].tolist())
 
-            for tag in problem['tags']:
-                tag_problems[tag['bojTagId']].append(problem['problemId'])
 
-    level_problems = {key: list(sorted(set(value))) for key, value in level_problems.items()}
+def get_problem_count_by_level(matrix: SolveMatrix, level_problem_count: dict) -> pd.DataFrame:
+    levels = np.arange(LEVEL_COUNT)
+    return pd.DataFrame({'level'       : levels,
+                         'count'       : [level_problem_count[level] for level in levels.tolist()],
+                         'solved_count': matrix.level_counts()},
+                        columns=['level', 'count', 'solved_count'])
 
-    tag_problems = {key: list(sorted(set(value))) for key, value in tag_problems.items()}
 
-    for key, value in tag_data.items():
-        new_value = value.copy()
-        new_value['solved_count'] = len(tag_problems[key])
-        tag_data[key] = new_value
+def get_problem_count_by_tag(matrix: SolveMatrix, tag_data: dict) -> pd.DataFrame:
+    tag_ids = np.fromiter(tag_data.keys(), dtype=np.int64, count=len(tag_data))
+    solved_count = matrix.tag_counts(minlength=int(tag_ids.max()) + 1 if len(tag_ids) else 0)
 
-    return level_problems, tag_data
+    return pd.DataFrame({'tag_id'      : tag_ids,
+                         'ko'          : [tag['ko'] for tag in tag_data.values()],
+                         'en'          : [tag['en'] for tag in tag_data.values()],
+                         'count'       : [tag['count'] for tag in tag_data.values()],
+                         'solved_count': solved_count[tag_ids]},
+                        columns=['tag_id', 'ko', 'en', 'count', 'solved_count'])
 
 
-def get_solved_problem_info(name="하나고등학교"):
+def get_solved_problem_info(matrix: SolveMatrix, user_data: pd.DataFrame):
     solved_problems_user: dict[int, dict[str, int | str]] = {}
 
-    for i, handle in enumerate(get_user_handle_list(get_organization_id(name))):
-        problems = get_user_solved_problem_list(handle)
-        user_data = get_organiztion_user_data().to_dict(orient="records")[i]
-
-        for problem in problems:
-            # print(problem)
-            if solved_problems_user.get(problem['problemId']) is None:
-                solved_problems_user[problem['problemId']] = {"handle": [], "tier": [], "user_count": 0}
-            solved_problems_user[problem['problemId']]["handle"].append(user_data["handle"])
-            solved_problems_user[problem['problemId']]["tier"].append(user_data["tier"])
-            solved_problems_user[problem['problemId']]['user_count'] += 1
-
-    # get tier average
-    for key, value in solved_problems_user.items():
-        solved_problems_user[key]["tier_avg"] = int(sum(value["tier"]) / len(value["tier"]))
+    member_tiers = user_data['tier'].to_numpy(dtype=np.int64)
+    tier_avg = matrix.tier_avg(member_tiers).tolist()
+    indptr, rows = matrix.solvers_by_problem()
+
+    handles = np.array(matrix.handles, dtype=object)
+    for i, problem_id in enumerate(matrix.problem_ids.tolist()):
+        solver_rows = rows[indptr[i]:indptr[i + 1]]
+        if not len(solver_rows):
+            continue
+        solved_problems_user[problem_id] = {
+                "handle"    : handles[solver_rows].tolist(),
+                "tier"      : member_tiers[solver_rows].tolist(),
+                "user_count": len(solver_rows),
+                "tier_avg"  : tier_avg[i],
+        }
 
     return solved_problems_user
 
 
-def get_solvedac_tag_list():
-    url = "https://solved.ac/api/v3/tag/list"
-
-    querystring = {"sort": "problemCount"}
-
-    headers = {"Accept": "application/json"}
-
-    i = 1
+async def get_solvedac_tag_list(client: SolvedacClient):
+    return await reference_cache.get(client, "tags", "/tag/list", {"sort": "problemCount"}, paged=True)
 
-    tag_list = []
 
-    while True:
-        querystring["page"] = i
-
-        response = requests.get(url, headers=headers, params=querystring)
-
-        # is empty
-        if not response.json()['items']:
-            break
-
-        tag_list.extend(response.json()['items'])
-
-        i += 1
-
-    return tag_list
-
-
-def get_solvedac_tag_dict():
+async def get_solvedac_tag_dict(client: SolvedacClient):
     tag_data = {}
-    tags = get_solvedac_tag_list()
+    tags = await get_solvedac_tag_list(client)
 
     for tag in tags:
         tag_data[tag['bojTagId']] = {'count': tag['problemCount'],
@@ -400,15 +631,9 @@ def get_solvedac_tag_dict():
     return tag_data
 
 
-def get_solvedac_problem_level_count():
-    url = "https://solved.ac/api/v3/problem/level"
-
-    headers = {"Accept": "application/json"}
-
-    response = requests.get(url, headers=headers)
-
+async def get_solvedac_problem_level_count(client: SolvedacClient):
     data = {}
-    for i in response.json():
+    for i in await reference_cache.get(client, "levels", "/problem/level"):
         data[i['level']] = i['count']
 
     return data
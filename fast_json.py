@@ -0,0 +1,23 @@
+import json
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson이 없으면 표준 json으로 직렬화한다.
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """pydantic 검증/jsonable_encoder를 거치지 않고 바로 직렬화하는 JSON 응답."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
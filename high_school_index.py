@@ -0,0 +1,87 @@
+import bisect
+
+import pandas as pd
+
+COMPARE_FIELDS = ("rating", "user_count", "solved_count")
+
+
+def _normalize(name: str) -> str:
+    return name.replace(" ", "").casefold()
+
+
+class HighSchoolIndex:
+    """고등학교 랭킹을 이름으로 바로 찾고, 이름 앞부분으로 검색하고, 순위 주변 학교를 찾기 위한 색인.
+
+    records는 순위순으로 정렬한 배열이고, 이름 -> 위치 사전과 (정규화한 이름, 위치)를 이름순으로 정렬한 배열을
+    스냅샷을 만들 때 한 번 만들어 둔다. 조회는 사전 찾기, 앞부분 검색은 이진 탐색, 주변 학교는 위치로 잘라낸다.
+    """
+
+    def __init__(self, high_school_data: pd.DataFrame):
+        records = high_school_data.to_dict(orient="records")
+        self.records = sorted(records, key=lambda record: (record['rank'], record['name']))
+
+        self.positions: dict[str, int] = {}
+        for position, record in enumerate(self.records):
+            self.positions.setdefault(record['name'], position)
+
+        names = sorted((_normalize(name), position) for name, position in self.positions.items())
+        self._names = [name for name, _ in names]
+        self._name_positions = [position for _, position in names]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, name: str) -> dict | None:
+        position = self.positions.get(name)
+        return None if position is None else self.records[position]
+
+    def search(self, prefix: str, limit: int = 10) -> list[dict]:
+        """이름이 prefix로 시작하는 학교를 순위순으로 limit개. 공백과 대소문자는 무시한다."""
+        prefix = _normalize(prefix)
+        if not prefix:
+            return self.records[:limit]
+
+        lo = bisect.bisect_left(self._names, prefix)
+        hi = bisect.bisect_left(self._names, prefix + "\U0010ffff", lo)
+        positions = sorted(self._name_positions[lo:hi])
+        return [self.records[position] for position in positions[:limit]]
+
+    def neighbors(self, name: str, k: int = 5) -> dict | None:
+        """name의 위아래로 k개씩, 순위순으로 늘어놓은 학교들."""
+        position = self.positions.get(name)
+        if position is None:
+            return None
+
+        return {
+                "above": self.records[max(position - k, 0):position],
+                "us"   : self.records[position],
+                "below": self.records[position + 1:position + 1 + k],
+        }
+
+    @staticmethod
+    def diff(us: dict, rival: dict) -> dict:
+        diff = {field: us[field] - rival[field] for field in COMPARE_FIELDS}
+        diff["rank"] = rival['rank'] - us['rank']
+        return diff
+
+    def compare(self, us_name: str, rival_name: str) -> dict | None:
+        us, rival = self.get(us_name), self.get(rival_name)
+        if us is None or rival is None:
+            return None
+        return {"opponent": rival, "us": us, "diff": self.diff(us, rival)}
+
+    def compare_many(self, us_name: str, rival_names: list[str]) -> dict | None:
+        """us_name을 여러 학교와 한 번에 비교한다. 없는 학교 이름은 not_found에 모은다."""
+        us = self.get(us_name)
+        if us is None:
+            return None
+
+        results, not_found = [], []
+        for rival_name in rival_names:
+            rival = self.get(rival_name)
+            if rival is None:
+                not_found.append(rival_name)
+            else:
+                results.append({"opponent": rival, "diff": self.diff(us, rival)})
+
+        return {"us": us, "results": results, "not_found": not_found}
@@ -0,0 +1,265 @@
+import json
+import os
+from bisect import bisect_left, bisect_right
+
+import pandas as pd
+
+import storage
+
+HISTORY_DIR = "history"
+
+# 고등학교 랭킹은 모든 단체가 함께 쓰므로 history/high_school/에 한 번만 기록한다.
+HIGH_SCHOOL_HISTORY = "high_school"
+
+# log.jsonl이 이 줄 수(일 수)만큼 쌓이면 압축 파일로 합친다.
+HISTORY_COMPACT_EVERY = int(os.environ.get("HISTORY_COMPACT_EVERY", 30))
+
+USER_FIELDS = ("rating", "solved_count", "tier")
+ORGANIZATION_FIELDS = ("rank", "rating", "user_count", "solved_count", "rank_high_school")
+HIGH_SCHOOL_FIELDS = ("rank", "rating", "user_count", "solved_count")
+
+ENTITIES = ("user", "organization", "level", "tag", "high_school")
+
+# (entity, key, field). 예: ("user", "handle", "rating"), ("level", "5", "solved_count")
+Series = tuple[str, str, str]
+
+_MISSING = object()
+
+
+def _value(value) -> int | None:
+    return None if pd.isna(value) else int(value)
+
+
+def snapshot_values(snapshot) -> dict[Series, int | None]:
+    """store.Snapshot에서 history로 남길 값들."""
+    values: dict[Series, int | None] = {}
+
+    for record in snapshot.user_data[['handle', *USER_FIELDS]].to_dict(orient="records"):
+        for field in USER_FIELDS:
+            values[("user", str(record['handle']), field)] = _value(record[field])
+
+    organization = snapshot.organization_record
+    for field in ORGANIZATION_FIELDS:
+        if field in organization:
+            values[("organization", organization['name'], field)] = _value(organization[field])
+
+    for record in snapshot.level_records:
+        values[("level", str(record['level']), "solved_count")] = _value(record['solved_count'])
+    for record in snapshot.tag_records:
+        values[("tag", str(record['tag_id']), "solved_count")] = _value(record['solved_count'])
+
+    return values
+
+
+def high_school_values(high_school_data: pd.DataFrame) -> dict[Series, int | None]:
+    values: dict[Series, int | None] = {}
+    for record in high_school_data[['name', *HIGH_SCHOOL_FIELDS]].to_dict(orient="records"):
+        for field in HIGH_SCHOOL_FIELDS:
+            values.setdefault(("high_school", record['name'], field), _value(record[field]))
+    return values
+
+
+class HistoryIndex:
+    """시계열마다 값이 바뀐 날짜와 그 값을 날짜순으로 들고 있는 색인.
+
+    값이 바뀐 날만 기록하므로, 어떤 날의 값은 그날 이전의 마지막 변경값이다. 날짜는 YYYY-MM-DD 문자열이라
+    문자열 순서가 곧 날짜 순서이고, 조회는 이진 탐색으로 한다. None은 그날부터 값이 없다(멤버가 떠남 등)는 뜻이다.
+    """
+
+    def __init__(self):
+        # entity -> key -> field -> (날짜 목록, 값 목록)
+        self.series: dict[str, dict[str, dict[str, tuple[list[str], list]]]] = {}
+
+    def add(self, date: str, entity: str, key: str, field: str, value: int | None) -> None:
+        dates, values = self.series.setdefault(entity, {}).setdefault(key, {}).setdefault(field, ([], []))
+        if dates and dates[-1] == date:
+            # 같은 날 두 번 크롤링했으면 나중 값이 이긴다.
+            values[-1] = value
+        elif not dates or dates[-1] < date:
+            dates.append(date)
+            values.append(value)
+        else:
+            i = bisect_left(dates, date)
+            if dates[i] == date:
+                values[i] = value
+            else:
+                dates.insert(i, date)
+                values.insert(i, value)
+
+    def latest(self) -> dict[Series, int | None]:
+        return {(entity, key, field): values[-1]
+                for entity, keys in self.series.items()
+                for key, fields in keys.items()
+                for field, (_, values) in fields.items()}
+
+    @staticmethod
+    def _value_at(dates: list[str], values: list, date: str | None) -> int | None:
+        if date is None:
+            return values[-1] if values else None
+        i = bisect_right(dates, date) - 1
+        return values[i] if i >= 0 else None
+
+    def query(self, entity: str, key: str, start: str | None = None, end: str | None = None,
+              fields: tuple[str, ...] | None = None) -> dict[str, list[dict]] | None:
+        """key의 필드별 [{date, value}] (start ~ end). start 이전에 값이 있었다면 start 날짜의 값으로 시작한다."""
+        series = self.series.get(entity, {}).get(key)
+        if series is None:
+            return None
+
+        result = {}
+        for field, (dates, values) in series.items():
+            if fields is not None and field not in fields:
+                continue
+
+            lo = 0 if start is None else bisect_left(dates, start)
+            hi = len(dates) if end is None else bisect_right(dates, end)
+            points = [{"date": dates[i], "value": values[i]} for i in range(lo, hi)]
+            if start is not None and lo > 0 and (not points or points[0]["date"] != start):
+                points.insert(0, {"date": start, "value": values[lo - 1]})
+            result[field] = points
+
+        return result
+
+    def diff(self, entity: str, start: str | None = None, end: str | None = None) -> dict[str, dict]:
+        """entity의 key별로 start와 end 사이에 값이 바뀐 필드의 {from, to, change}."""
+        result = {}
+        for key, fields in self.series.get(entity, {}).items():
+            changed = {}
+            for field, (dates, values) in fields.items():
+                before = None if start is None else self._value_at(dates, values, start)
+                after = self._value_at(dates, values, end)
+                if before != after:
+                    changed[field] = {
+                            "from"  : before,
+                            "to"    : after,
+                            "change": after - before if before is not None and after is not None else None,
+                    }
+            if changed:
+                result[key] = changed
+        return result
+
+    def to_frame(self) -> pd.DataFrame:
+        rows = {"entity": [], "key": [], "field": [], "date": [], "value": []}
+        for entity, keys in self.series.items():
+            for key, fields in keys.items():
+                for field, (dates, values) in fields.items():
+                    rows["entity"].extend([entity] * len(dates))
+                    rows["key"].extend([key] * len(dates))
+                    rows["field"].extend([field] * len(dates))
+                    rows["date"].extend(dates)
+                    rows["value"].extend(values)
+
+        return pd.DataFrame({**rows, "value": pd.array(rows["value"], dtype="Int64")},
+                            columns=["entity", "key", "field", "date", "value"])
+
+
+class HistoryStore:
+    """디렉터리 하나에 쌓는 append-only 변경 기록.
+
+    log.jsonl   : 하루에 한 줄. 직전 기록과 값이 달라진 시계열만 [entity, key, field, value]로 적는다.
+    history.*   : HISTORY_COMPACT_EVERY줄마다 log를 (entity, key, field, date, value) 표 하나로 합치고 log를 비운다.
+                  storage.STORAGE_FORMAT 형식으로 저장한다.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.log_path = os.path.join(directory, "log.jsonl")
+        self.log_length = 0
+
+    def _load_compacted(self, index: HistoryIndex) -> None:
+        try:
+            frame = storage.load_frame("history", self.directory,
+                                       dtype={"entity": str, "key": str, "field": str, "date": str},
+                                       keep_default_na=False, na_values={"value": [""]})
+        except FileNotFoundError:
+            return
+
+        frame = frame.sort_values("date", kind="stable")
+        for entity, key, field, date, value in zip(frame["entity"], frame["key"], frame["field"], frame["date"],
+                                                   frame["value"]):
+            index.add(date, entity, key, field, _value(value))
+
+    def _read_log(self) -> list[dict]:
+        try:
+            with open(self.log_path, 'r') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def load(self) -> HistoryIndex:
+        index = HistoryIndex()
+        self._load_compacted(index)
+
+        entries = self._read_log()
+        self.log_length = len(entries)
+        # 압축 직후 log를 비우기 전에 죽었어도, 같은 날짜의 같은 값을 다시 넣는 것이라 결과는 같다.
+        for entry in entries:
+            for entity, key, field, value in entry['changes']:
+                index.add(entry['date'], entity, key, field, value)
+        return index
+
+    def append(self, date: str, values: dict[Series, int | None]) -> HistoryIndex:
+        """date의 값들 중 바뀐 것만 log에 한 줄로 덧붙이고, 갱신된 색인을 돌려준다."""
+        index = self.load()
+        latest = index.latest()
+
+        changes = [[*series, value] for series, value in values.items() if latest.get(series, _MISSING) != value]
+        # 이번에 없는 시계열(단체를 떠난 멤버 등)은 None으로 닫는다.
+        changes += [[*series, None] for series, value in latest.items() if series not in values and value is not None]
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps({"date": date, "changes": changes}, ensure_ascii=False) + "\n")
+        self.log_length += 1
+
+        for entity, key, field, value in changes:
+            index.add(date, entity, key, field, value)
+
+        if self.log_length >= HISTORY_COMPACT_EVERY:
+            self.compact(index)
+        return index
+
+    def compact(self, index: HistoryIndex | None = None) -> None:
+        index = index or self.load()
+        storage.save_frame(index.to_frame(), "history", self.directory)
+
+        storage.atomic_write(self.log_path, "")
+        self.log_length = 0
+
+
+def history_dir(name: str) -> str:
+    return os.path.join(HISTORY_DIR, name)
+
+
+# history 이름(organization_id 또는 HIGH_SCHOOL_HISTORY) -> 색인. store와 같이 참조를 통째로 바꾼다.
+_current: dict[str, HistoryIndex] = {}
+
+
+def get(name: str) -> HistoryIndex | None:
+    return _current.get(name)
+
+
+def indexes() -> dict[str, HistoryIndex]:
+    return _current
+
+
+def load(names: list[str]) -> dict[str, HistoryIndex]:
+    global _current
+    _current = {name: HistoryStore(history_dir(name)).load() for name in names}
+    return _current
+
+
+def record(date: str, snapshots: dict) -> dict[str, HistoryIndex]:
+    """store.reload()가 돌려준 단체별 스냅샷을 date의 기록으로 남기고 색인을 바꾼다."""
+    global _current
+    indexes = {}
+    for snapshot in snapshots.values():
+        name = str(snapshot.organization_id)
+        indexes[name] = HistoryStore(history_dir(name)).append(date, snapshot_values(snapshot))
+
+    high_school_data = next(iter(snapshots.values())).high_school_data
+    indexes[HIGH_SCHOOL_HISTORY] = HistoryStore(history_dir(HIGH_SCHOOL_HISTORY)).append(
+            date, high_school_values(high_school_data))
+
+    _current = indexes
+    return indexes
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# 순위를 매길 수 있는 user_data 열. 모두 클수록 높은 순위다.
+RANK_FIELDS = ("rating", "solved_count", "class", "vote_count")
+
+
+class Leaderboard:
+    """멤버를 RANK_FIELDS마다 내림차순으로 정렬해 둔 색인.
+
+    필드마다 정렬 순서(user_records의 위치 배열)와 그 순서대로 부호를 뒤집은 값(오름차순이 된다)을 스냅샷을 만들 때
+    한 번 만들어 둔다. 같은 값은 같은 순위(1, 2, 2, 4, ...)이고, 목록에서는 handle 순으로 늘어놓는다.
+    순위는 이진 탐색으로, 상위 k명과 주변 멤버는 정렬 순서를 잘라서 구한다. 값이 없는 멤버는 순위에서 뺀다.
+    """
+
+    def __init__(self, user_data: pd.DataFrame, user_records: list[dict], user_positions: dict[str, int],
+                 fields: tuple[str, ...] = RANK_FIELDS):
+        self.records = user_records
+        self.user_positions = user_positions
+        self.columns = tuple(user_data.columns)
+        self.fields = tuple(field for field in fields if field in self.columns)
+
+        handles = user_data['handle'].astype(str).to_numpy()
+        self._order: dict[str, np.ndarray] = {}
+        self._keys: dict[str, np.ndarray] = {}
+        self._positions: dict[str, np.ndarray] = {}
+        for field in self.fields:
+            values = pd.to_numeric(user_data[field], errors="coerce").to_numpy(dtype=np.float64)
+            ranked = np.flatnonzero(~np.isnan(values))
+            # np.lexsort는 마지막 키가 먼저다: 값 내림차순, 같으면 handle 순
+            order = ranked[np.lexsort((handles[ranked], -values[ranked]))]
+
+            positions = np.full(len(values), -1, dtype=np.int64)
+            positions[order] = np.arange(len(order))
+
+            self._order[field] = order
+            self._keys[field] = -values[order]
+            self._positions[field] = positions
+
+    def total(self, field: str) -> int:
+        return len(self._order[field])
+
+    def _check_fields(self, fields: tuple[str, ...] | None) -> None:
+        unknown = set(fields or ()) - set(self.columns)
+        if unknown:
+            raise ValueError(f"unknown fields: {sorted(unknown)}")
+
+    def _rank_at(self, field: str, position: int) -> int:
+        keys = self._keys[field]
+        return int(np.searchsorted(keys, keys[position], side="left")) + 1
+
+    def _entry(self, field: str, position: int, fields: tuple[str, ...] | None) -> dict:
+        record = self.records[self._order[field][position]]
+        entry = {name: record[name] for name in fields} if fields else dict(record)
+        entry["rank"] = self._rank_at(field, position)
+        return entry
+
+    def _position(self, field: str, handle: str) -> int | None:
+        user_position = self.user_positions.get(handle)
+        if user_position is None:
+            return None
+        position = int(self._positions[field][user_position])
+        return None if position < 0 else position
+
+    def top(self, field: str, limit: int = 10, offset: int = 0, fields: tuple[str, ...] | None = None) -> list[dict]:
+        """field 순위 offset번째부터 limit명."""
+        self._check_fields(fields)
+        end = min(offset + limit, self.total(field))
+        return [self._entry(field, position, fields) for position in range(offset, end)]
+
+    def rank(self, field: str, handle: str) -> dict | None:
+        """handle의 field 순위와 백분위. 순위가 없으면(없는 멤버이거나 값이 없으면) None.
+
+        percentile은 값이 더 낮은 멤버와 같은 값인 멤버의 절반(자기 포함)의 비율, top_percent는 순위 / 전체다.
+        """
+        position = self._position(field, handle)
+        if position is None:
+            return None
+
+        keys = self._keys[field]
+        lo = int(np.searchsorted(keys, keys[position], side="left"))
+        hi = int(np.searchsorted(keys, keys[position], side="right"))
+        total = len(keys)
+
+        return {
+                "handle"     : handle,
+                "field"      : field,
+                "value"      : self.records[self._order[field][position]][field],
+                "rank"       : lo + 1,
+                "ties"       : hi - lo,
+                "total"      : total,
+                "percentile" : round(100 * ((total - hi) + (hi - lo) / 2) / total, 2),
+                "top_percent": round(100 * (lo + 1) / total, 2),
+        }
+
+    def window(self, field: str, handle: str, k: int = 5, fields: tuple[str, ...] | None = None) -> dict | None:
+        """handle의 위아래로 k명씩, field 순위순으로 늘어놓은 멤버들."""
+        self._check_fields(fields)
+        position = self._position(field, handle)
+        if position is None:
+            return None
+
+        return {
+                "above": [self._entry(field, i, fields) for i in range(max(position - k, 0), position)],
+                "us"   : self._entry(field, position, fields),
+                "below": [self._entry(field, i, fields)
+                          for i in range(position + 1, min(position + 1 + k, self.total(field)))],
+        }
@@ -1,13 +1,21 @@
+import asyncio
 import os
-from fastapi import FastAPI, HTTPException
+import threading
+import time
+from fastapi import FastAPI, HTTPException, Query
+import coordination
 import crawl
+import fast_json
+import history
+import metrics
+import response_cache
+import store
+from croniter import croniter
 from fastapi_utilities import repeat_at
-import pandas as pd
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from datetime import datetime, timedelta
-from fastapi.responses import RedirectResponse
-import json
+from datetime import date, datetime, timedelta
+from fastapi.responses import PlainTextResponse, RedirectResponse
 
 app = FastAPI()
 
@@ -17,6 +25,30 @@ async def root_redirection():
     return RedirectResponse("/docs")
 
 
+# 매일 자정에 다시 크롤링한다. 응답의 Cache-Control도 다음 크롤링 시각까지로 정한다.
+SYNC_CRON = "0 0 * * *"
+
+
+def seconds_until_next_sync() -> int:
+    now = datetime.now()
+    return max(int((croniter(SYNC_CRON, now).get_next(datetime) - now).total_seconds()), 0)
+
+
+def _snapshot_tag() -> str:
+    snapshot = store.get()
+    return snapshot.updated_at.strftime("%Y%m%d%H%M%S") if snapshot is not None else "0"
+
+
+# 데이터는 크롤링할 때만 바뀌므로 응답을 스냅샷 버전별로 미리 압축해 캐시한다.
+# CORS 헤더가 캐시된 응답에도 붙도록 CORSMiddleware보다 먼저(안쪽에) 등록한다.
+app.add_middleware(
+        response_cache.ResponseCacheMiddleware,
+        version=lambda: (store.snapshots(), history.indexes()),
+        tag=_snapshot_tag,
+        max_age=seconds_until_next_sync,
+        routes=app.routes,
+)
+
 origins = ["*"]  # TODO: change to frontend url
 
 app.add_middleware(
@@ -27,147 +59,386 @@ app.add_middleware(
         allow_headers=["*"],
 )
 
+# 응답 캐시와 CORS를 거친 응답까지 재도록 가장 바깥에 둔다.
+app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-try:
-    updated_at: datetime = datetime.strptime(open("updated_at.txt", "r").read(), "%Y-%m-%d %H:%M:%S")
-    if updated_at < datetime.now() - timedelta(days=1):
-        raise FileNotFoundError
-    open("user_data.csv", 'r')
-    open("organization_data.csv", 'r')
-    open("problem_count_by_level.csv", 'r')
-    open("problem_count_by_tag.csv", 'r')
-    open("problem_info.json", 'r')
-    open("high_school_data.csv", 'r')
-except FileNotFoundError:
-    crawl.main()
-    while True:
-        break  # TODO: delete(disable retry)
+# 이 시간보다 오래된 스냅샷이면 서버 시작 직후 백그라운드에서 다시 크롤링한다.
+MAX_SNAPSHOT_AGE = timedelta(hours=float(os.environ.get("MAX_SNAPSHOT_AGE_HOURS", 24)))
+
+# 크롤링 전체가 실패했을 때 다시 시도하는 횟수와 첫 대기 시간(초, 시도마다 두 배)
+SYNC_MAX_ATTEMPTS = int(os.environ.get("SYNC_MAX_ATTEMPTS", 3))
+SYNC_RETRY_DELAY = float(os.environ.get("SYNC_RETRY_DELAY", 300))
+
+_sync_lock = threading.Lock()
+_background_refresh: asyncio.Future | None = None
+_snapshot_watcher: asyncio.Task | None = None
+
+# 지금 이 프로세스가 서비스 중인 스냅샷의 coordination.snapshot.version 값
+_snapshot_version: str | None = None
+
+
+def _load_published():
+    """디스크에 공개된 스냅샷과 history를 읽어 들인다. 크롤링하는 worker가 쓰는 중이면 다 쓸 때까지 기다린다."""
+    global _snapshot_version
+
+    with coordination.reading_snapshot():
+        version = coordination.read_version()
+        try:
+            store.reload()
+        except (FileNotFoundError, ValueError) as e:
+            logger.info(f"no snapshot to serve yet ({e}); responding 503 until the first crawl finishes")
+        history.load([str(organization['organization_id']) for organization in store.organizations()]
+                     + [history.HIGH_SCHOOL_HISTORY])
+    _snapshot_version = version
+
+
+# 크롤링을 기다리지 않고, 디스크에 남아 있는 마지막 스냅샷(오래됐더라도)으로 바로 서비스를 시작한다.
+_load_published()
+
+# 크롤링 전체를 다시 시도하는 중이면 몇 번째 시도인지와 다음 시도 시각을 /status에 보여 준다.
+_sync_status: dict = {"attempt": None, "next_retry_at": None}
+
+
+def current_snapshot(organization: str | None = None) -> store.Snapshot:
+    """organization(이름 또는 organization_id, 없으면 기본 단체)의 스냅샷."""
+    snapshot = store.get(organization)
+    if snapshot is None:
+        if not store.organizations():
+            raise HTTPException(status_code=503, detail="warming up: first crawl is in progress",
+                                headers={"Retry-After": "60"})
+        raise HTTPException(status_code=404, detail=f"{organization} Not Found")
+    return snapshot
+
+
+def refresh():
+    """크롤링 후 새 스냅샷을 공개하고 history를 남긴다. 이미 다른 크롤링이 돌고 있으면 건너뛴다."""
+    if not _sync_lock.acquire(blocking=False):
+        logger.info("sync already in progress; skipping")
+        return
+
+    # worker가 여럿이어도 크롤링은 crawl.lock을 잡은 프로세스 하나만 한다. 나머지는 공개된 스냅샷을 읽어 들인다.
+    crawl_lock = coordination.FileLock(coordination.CRAWL_LOCK_PATH)
+    if not crawl_lock.acquire(blocking=False):
+        _sync_lock.release()
+        logger.info("another worker is crawling; skipping")
+        return
+
+    try:
+        if coordination.read_version() != _snapshot_version:
+            # 크롤링하기로 한 사이 다른 worker가 새 스냅샷을 공개했다.
+            logger.info("another worker published a new snapshot; loading it instead of crawling")
+            _load_published()
+            return
+        _refresh()
+    finally:
+        crawl_lock.release()
+        _sync_lock.release()
+
+
+def _refresh():
+    global _snapshot_version
+
+    logger.info("syncing organization_data")
+    # 개별 요청은 client.SolvedacClient가 재시도하므로, 여기서는 크롤링 전체를 드물게, 간격을 두고만 다시 시도한다.
+    for attempt in range(1, SYNC_MAX_ATTEMPTS + 1):
+        _sync_status.update(attempt=attempt, next_retry_at=None)
         try:
             crawl.main()
             break
         except Exception as e:
             logger.error(e)
-            logger.info("retrying...")  # pd.read_csv("user_data.csv", index_col=0)
-    # pd.read_csv("organization_data.csv")
-
+            if attempt == SYNC_MAX_ATTEMPTS:
+                logger.error("giving up; keep serving the previous snapshot")
+                _sync_status.update(attempt=None)
+                return
+            delay = SYNC_RETRY_DELAY * 2 ** (attempt - 1)
+            logger.info(f"retrying in {delay:.0f}s...")
+            metrics.SYNC_RETRIES.inc()
+            _sync_status.update(next_retry_at=datetime.now() + timedelta(seconds=delay))
+            time.sleep(delay)
+    _sync_status.update(attempt=None)
 
-async def get_user_dataFrame() -> pd.DataFrame:
-    return pd.read_csv("user_data.csv").fillna('null')
+    with coordination.writing_snapshot():
+        # 크롤링이 끝난 뒤에만 새 스냅샷으로 교체하므로, 요청은 쓰다 만 파일을 보지 않는다.
+        snapshots = store.reload()
 
+        # 매일 전체 표를 복사하는 대신 전날과 달라진 값만 history에 덧붙인다.
+        history_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        history.record(history_date, snapshots)
 
-async def get_organization_dataFrame() -> pd.DataFrame:
-    return pd.read_csv("organization_data.csv")
+        # history까지 다 쓴 뒤에 버전을 바꿔야 다른 worker가 새 스냅샷과 history를 함께 읽어 들인다.
+        _snapshot_version = coordination.publish_version()
 
 
 @app.on_event("startup")
-@repeat_at(cron="0 0 * * *", raise_exceptions=True, logger=logging.getLogger(__name__))
+@repeat_at(cron=SYNC_CRON, raise_exceptions=True, logger=logging.getLogger(__name__))
 def sync():
-    global updated_at
+    refresh()
 
-    logger.info("syncing organization_data")
+
+@app.on_event("startup")
+async def refresh_if_stale():
+    global _background_refresh
+
+    snapshot = store.get()
+    # 설정에 새로 추가된 단체가 있으면 스냅샷이 최신이어도 다시 크롤링한다.
+    # 지난 크롤링의 단체 색인에 없던(찾지 못한) 이름은 다시 크롤링해도 찾지 못하므로 빼고 비교한다.
+    served = {organization['name'] for organization in store.organizations()}
+    directory = crawl.load_organization_directory()
+    wanted = {name for name in crawl.ORGANIZATIONS if name in directory}
+    if (snapshot is not None and snapshot.updated_at >= datetime.now() - MAX_SNAPSHOT_AGE
+            and served >= wanted):
+        logger.info(f"snapshot from {snapshot.updated_at} is fresh; skipping startup crawl")
+        return
+
+    # stale-while-revalidate: 지금 있는 스냅샷을 계속 서비스하면서 백그라운드에서 새로 크롤링한다.
+    _background_refresh = asyncio.get_running_loop().run_in_executor(None, refresh)
+
+
+async def _watch_snapshot_version():
     while True:
+        await asyncio.sleep(coordination.SNAPSHOT_POLL_SECONDS)
+        # 이 프로세스가 크롤링 중이면 끝나고 직접 공개하므로 기다린다.
+        if _sync_lock.locked() or coordination.read_version() == _snapshot_version:
+            continue
+
+        logger.info("a new snapshot was published; reloading")
         try:
-            crawl.main()
-            break
+            await asyncio.get_running_loop().run_in_executor(None, _load_published)
         except Exception as e:
             logger.error(e)
-            logger.info("retrying...")
-
-    updated_at = datetime.strptime(open("updated_at.txt", "r").read(), "%Y-%m-%d %H:%M:%S")
-    user_data = pd.read_csv("user_data.csv", index_col=0)
-    organization_data = pd.read_csv("organization_data.csv")
-    problem_by_level = pd.read_csv("problem_count_by_level.csv")
-    problem_by_tag = pd.read_csv("problem_count_by_tag.csv")
-    high_school_data = pd.read_csv("high_school_data.csv")
-
-    os.makedirs("./history", exist_ok=True)
-
-    user_data.to_csv(f'./history/user_data_{(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")}.csv',
-                     index=False)
-    organization_data.to_csv(
-            f'./history/organization_data_{(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")}.csv',
-            index=False)
-    problem_by_level.to_csv(
-            f'./history/problem_count_by_level_{(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")}.csv',
-            index=False)
-    problem_by_tag.to_csv(
-            f'./history/problem_count_by_tag_{(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")}.csv',
-            index=False)
-    high_school_data.to_csv(
-            f'./history/high_school_data_{(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")}.csv',
-            index=False)
+
+
+@app.on_event("startup")
+async def watch_snapshot_version():
+    """다른 worker가 크롤링해 공개한 스냅샷을 읽어 들인다."""
+    global _snapshot_watcher
+    _snapshot_watcher = asyncio.get_running_loop().create_task(_watch_snapshot_version())
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # starlette가 text/* 에는 charset=utf-8을 붙인다.
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/status")
+async def get_status():
+    """마지막(또는 진행 중인) 크롤링의 단계별 시간, 요청/재시도 수와 지금 서비스 중인 스냅샷."""
+    return {
+            "crawl"    : metrics.crawl_status(),
+            "sync"     : {"running": _sync_lock.locked(), **_sync_status},
+            "worker"   : {"pid": os.getpid(), "snapshot_version": _snapshot_version},
+            "snapshots": {name: snapshot.updated_at for name, snapshot in store.snapshots().items()},
+    }
+
+
+@app.get("/organizations")
+async def get_organization_list() -> dict[str, list]:
+    current_snapshot()
+    return {"organizations": store.organizations()}
 
 
 @app.get("/organization")
-async def get_organization_data() -> dict[str, dict]:
-    organization_data = await get_organization_dataFrame()
-    return {"organization_data": organization_data.to_dict(orient="records")[0]}
+async def get_organization_data(organization: str = None) -> dict[str, dict]:
+    return {"organization_data": current_snapshot(organization).organization_record}
 
 
 @app.get("/updated")
-async def get_updated_time() -> datetime:
-    return updated_at
+async def get_updated_time(organization: str = None) -> datetime:
+    return current_snapshot(organization).updated_at
 
 
 @app.get("/user")
-async def get_user_data() -> dict[str, list]:
-    user_data = await get_user_dataFrame()
-    return {"user_data": user_data.to_dict(orient="records")}
+async def get_user_data(fields: str = None, limit: int = Query(None, ge=1, le=1000), cursor: str = None,
+                        organization: str = None):
+    snapshot = current_snapshot(organization)
+    if fields is None and limit is None and cursor is None:
+        # 예전 클라이언트를 위해 조건이 없으면 전체 목록을 그대로 돌려준다. 스냅샷마다 한 번 직렬화해 응답 캐시에 둔다.
+        return fast_json.FastJSONResponse({"user_data": snapshot.user_records})
+
+    try:
+        return fast_json.FastJSONResponse(
+                snapshot.query_users(tuple(fields.split(",")) if fields else None, limit or 100, cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/problem/level")
-async def get_problem_list(level_id: int = None) -> dict[str, list]:
-    problem_by_level = pd.read_csv("problem_count_by_level.csv")
-    if level_id:
-        return {"problem_list": problem_by_level[problem_by_level['level'] == level_id].to_dict(orient="records")}
+async def get_problem_list(level_id: int = None, organization: str = None) -> dict[str, list]:
+    snapshot = current_snapshot(organization)
+    if level_id is not None:
+        return {"problem_list": snapshot.level_index.get(level_id, [])}
     else:
-        return {"problem_list": problem_by_level.to_dict(orient="records")}
+        return {"problem_list": snapshot.level_records}
 
 
 @app.get("/problem/tag")
-async def get_problem_tag(tag_id: int = None) -> dict[str, list]:
-    problem_by_tag = pd.read_csv("problem_count_by_tag.csv")
-    if tag_id:
-        return {"problem_list": problem_by_tag[problem_by_tag['tag_id'] == tag_id].to_dict(orient="records")}
+async def get_problem_tag(tag_id: int = None, organization: str = None) -> dict[str, list]:
+    snapshot = current_snapshot(organization)
+    if tag_id is not None:
+        return {"problem_list": snapshot.tag_index.get(tag_id, [])}
     else:
-        return {"problem_tag": problem_by_tag.to_dict(orient="records")}
+        return {"problem_tag": snapshot.tag_records}
 
 
 @app.get("/problem")
-async def get_problem_list(problem_id: int = None):
-    with open("problem_info.json", "r") as f:
-        problem_dict = json.load(f)
-    if problem_id:
-        return {"problem_dict": problem_dict.get(str(problem_id), None)}
-    else:
-        return {"problem_dict": problem_dict}
+async def get_problem_list(problem_id: int = None, handle: str = None,
+                           tier_avg_min: int = None, tier_avg_max: int = None,
+                           user_count_min: int = None, user_count_max: int = None,
+                           sort: str = None, order: str = None, cursor: str = None,
+                           limit: int = Query(None, ge=1, le=1000), fields: str = None,
+                           organization: str = None):
+    problem_index = current_snapshot(organization).problem_index
+    if problem_id is not None:
+        return fast_json.FastJSONResponse({"problem_dict": problem_index.get(problem_id)})
+
+    query = {"handle"        : handle,
+             "tier_avg_min"  : tier_avg_min, "tier_avg_max": tier_avg_max,
+             "user_count_min": user_count_min, "user_count_max": user_count_max}
+    if all(value is None for value in [*query.values(), sort, order, cursor, limit, fields]):
+        # 예전 클라이언트를 위해 조건이 하나도 없으면 전체 딕셔너리를 그대로 돌려준다. 스냅샷마다 한 번 직렬화해 응답 캐시에 둔다.
+        return fast_json.FastJSONResponse({"problem_dict": problem_index.records})
+
+    try:
+        return fast_json.FastJSONResponse(
+                problem_index.query(**query, sort=sort or "problem_id", order=order or "asc", cursor=cursor,
+                                    limit=limit or 100, fields=tuple(fields.split(",")) if fields else None))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/vs/high_school")
-async def get_vs_high_school(hs_name: str):
-    high_school_data = pd.read_csv("high_school_data.csv")
+async def get_vs_high_school(hs_name: str, us: str = None, organization: str = None):
+    snapshot = current_snapshot(organization)
+
+    comparison = snapshot.high_school_index.compare(us or snapshot.organization_record['name'], hs_name)
+    if comparison is None:
+        raise HTTPException(status_code=404, detail=f"{hs_name} Not Found")
+
+    return comparison
+
+
+@app.get("/vs/high_school/batch")
+async def get_vs_high_school_batch(hs_name: list[str] = Query(...), us: str = None, organization: str = None):
+    """us(없으면 organization의 학교)를 hs_name으로 여러 번 넘긴 학교들과 한 번에 비교한다."""
+    snapshot = current_snapshot(organization)
+    us = us or snapshot.organization_record['name']
 
-    rival_high_school_df = high_school_data[high_school_data['name'] == hs_name]
-    my_high_school_df = high_school_data[high_school_data['name'] == "하나고등학교"]
+    comparison = snapshot.high_school_index.compare_many(us, hs_name)
+    if comparison is None:
+        raise HTTPException(status_code=404, detail=f"{us} Not Found")
 
-    if rival_high_school_df.empty or my_high_school_df.empty:
+    return comparison
+
+
+@app.get("/high_school/search")
+async def search_high_school(q: str, limit: int = Query(10, ge=1, le=100)) -> dict[str, list]:
+    return {"high_schools": current_snapshot().high_school_index.search(q, limit)}
+
+
+@app.get("/high_school/neighbors")
+async def get_high_school_neighbors(hs_name: str = None, k: int = Query(5, ge=0, le=100),
+                                    organization: str = None):
+    snapshot = current_snapshot(organization)
+    hs_name = hs_name or snapshot.organization_record['name']
+
+    neighbors = snapshot.high_school_index.neighbors(hs_name, k)
+    if neighbors is None:
         raise HTTPException(status_code=404, detail=f"{hs_name} Not Found")
 
-    rival_high_school = rival_high_school_df.to_dict(orient="records")[0]
-    my_high_school = my_high_school_df.to_dict(orient="records")[0]
+    return neighbors
 
-    rating_diff = my_high_school['rating'] - rival_high_school['rating']
-    user_count_diff = my_high_school['user_count'] - rival_high_school['user_count']
-    solved_count_diff = my_high_school['solved_count'] - rival_high_school['solved_count']
-    rank_diff = rival_high_school['rank'] - my_high_school['rank']
 
-    diff = {
-            "rating"      : rating_diff,
-            "user_count"  : user_count_diff,
-            "solved_count": solved_count_diff,
-            "rank"        : rank_diff,
-    }
+def _leaderboard(field: str, organization: str | None):
+    leaderboard = current_snapshot(organization).leaderboard
+    if field not in leaderboard.fields:
+        raise HTTPException(status_code=404, detail=f"{field} Not Found")
+    return leaderboard
+
+
+@app.get("/leaderboard/{field}")
+async def get_leaderboard(field: str, limit: int = Query(10, ge=1, le=1000), offset: int = Query(0, ge=0),
+                          fields: str = None, organization: str = None):
+    """field(rating, solved_count, class, vote_count) 순위 offset번째부터 limit명. 같은 값은 같은 순위다."""
+    leaderboard = _leaderboard(field, organization)
+    try:
+        ranking = leaderboard.top(field, limit, offset, tuple(fields.split(",")) if fields else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return fast_json.FastJSONResponse({"field": field, "total": leaderboard.total(field), "ranking": ranking})
+
+
+@app.get("/leaderboard/{field}/rank")
+async def get_leaderboard_rank(field: str, handle: str, organization: str = None):
+    """handle의 field 순위, 같은 값인 멤버 수와 백분위."""
+    rank = _leaderboard(field, organization).rank(field, handle)
+    if rank is None:
+        raise HTTPException(status_code=404, detail=f"{handle} Not Found")
+
+    return fast_json.FastJSONResponse(rank)
+
+
+@app.get("/leaderboard/{field}/window")
+async def get_leaderboard_window(field: str, handle: str, k: int = Query(5, ge=0, le=100), fields: str = None,
+                                 organization: str = None):
+    """handle의 위아래로 k명씩, field 순위순으로."""
+    try:
+        window = _leaderboard(field, organization).window(field, handle, k,
+                                                          tuple(fields.split(",")) if fields else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if window is None:
+        raise HTTPException(status_code=404, detail=f"{handle} Not Found")
+
+    return fast_json.FastJSONResponse(window)
+
+
+def _history_index(entity: str, organization: str | None) -> tuple[history.HistoryIndex, store.Snapshot]:
+    if entity not in history.ENTITIES:
+        raise HTTPException(status_code=404, detail=f"{entity} Not Found")
+
+    snapshot = current_snapshot(organization)
+    name = history.HIGH_SCHOOL_HISTORY if entity == "high_school" else str(snapshot.organization_id)
+    index = history.get(name)
+    if index is None:
+        raise HTTPException(status_code=404, detail="no history recorded yet")
+    return index, snapshot
+
+
+def _date_range(start: date | None, end: date | None) -> tuple[str | None, str | None]:
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start and start.isoformat(), end and end.isoformat()
+
+
+@app.get("/history/{entity}")
+async def get_history(entity: str, key: str = None, start: date = None, end: date = None, fields: str = None,
+                      organization: str = None):
+    """entity(user, organization, level, tag, high_school)의 key(handle, 단체 이름, 레벨, 태그 id, 학교 이름)
+    시계열. 값이 바뀐 날짜만 담는다."""
+    index, snapshot = _history_index(entity, organization)
+    if key is None:
+        if entity != "organization":
+            raise HTTPException(status_code=400, detail="key is required")
+        key = snapshot.organization_record['name']
+
+    start, end = _date_range(start, end)
+    series = index.query(entity, key, start, end, tuple(fields.split(",")) if fields else None)
+    if series is None:
+        raise HTTPException(status_code=404, detail=f"{key} Not Found")
+
+    return {"entity": entity, "key": key, "history": series}
+
+
+@app.get("/history/{entity}/diff")
+async def get_history_diff(entity: str, start: date = None, end: date = None, organization: str = None):
+    """start와 end 사이에 값이 바뀐 key와 필드별 {from, to, change}. start가 없으면 처음부터, end가 없으면 최신까지."""
+    index, _ = _history_index(entity, organization)
+    start, end = _date_range(start, end)
 
-    return {"opponent": rival_high_school, "us": my_high_school, "diff": diff}
+    return {"entity": entity, "start": start, "end": end, "diff": index.diff(entity, start, end)}
@@ -0,0 +1,79 @@
+from itertools import chain
+
+import numpy as np
+
+LEVEL_COUNT = 31  # 0(Unrated) ~ 30(Ruby I)
+
+
+class SolveMatrix:
+    """멤버 x 문제 풀이 여부를 담은 CSR 희소 행렬과, 문제별 레벨/태그 배열.
+
+    행은 멤버(handles 순서), 열은 문제(problem_ids 오름차순)이다. 행 i가 푼 문제의 열 번호는
+    indices[indptr[i]:indptr[i + 1]]이고, 문제 j의 태그는 tag_ids[tag_indptr[j]:tag_indptr[j + 1]]이다.
+    모든 집계는 이 배열들에 대한 벡터 연산으로 계산한다.
+    """
+
+    def __init__(self, handles: list[str], problem_ids: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 problem_level: np.ndarray, tag_indptr: np.ndarray, tag_ids: np.ndarray):
+        self.handles = handles
+        self.problem_ids = problem_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.problem_level = problem_level
+        self.tag_indptr = tag_indptr
+        self.tag_ids = tag_ids
+
+    @classmethod
+    def from_solved_cache(cls, cache: dict, handles: list[str]) -> "SolveMatrix":
+        """crawl.load_solved_cache() 형식의 캐시에서 handles 순서대로 행렬을 만든다.
+
+        캐시는 여러 단체가 함께 쓰므로, 열은 handles 중 한 명이라도 푼 문제로만 만든다.
+        """
+        member_problems = [cache['members'].get(handle, {}).get('problems', []) for handle in handles]
+        indptr = np.zeros(len(handles) + 1, dtype=np.int64)
+        np.cumsum([len(problems) for problems in member_problems], out=indptr[1:])
+        solved = np.fromiter(chain.from_iterable(member_problems), dtype=np.int64, count=int(indptr[-1]))
+        problem_ids = np.unique(solved)
+        indices = np.searchsorted(problem_ids, solved).astype(np.int32)
+
+        problems = [cache['problems'][problem_id] for problem_id in problem_ids.tolist()]
+        problem_level = np.array([problem['level'] for problem in problems], dtype=np.int8)
+        tag_indptr = np.zeros(len(problems) + 1, dtype=np.int64)
+        np.cumsum([len(problem['tags']) for problem in problems], out=tag_indptr[1:])
+        tag_ids = np.fromiter(chain.from_iterable(problem['tags'] for problem in problems), dtype=np.int32,
+                              count=int(tag_indptr[-1]))
+
+        return cls(handles, problem_ids, indptr, indices, problem_level, tag_indptr, tag_ids)
+
+    def entry_rows(self) -> np.ndarray:
+        """indices와 같은 길이로, 각 풀이 기록이 속한 행(멤버) 번호."""
+        return np.repeat(np.arange(len(self.handles), dtype=np.int32), np.diff(self.indptr))
+
+    def solver_counts(self) -> np.ndarray:
+        """문제(열)별로 푼 멤버 수."""
+        return np.bincount(self.indices, minlength=len(self.problem_ids))
+
+    def solved_mask(self) -> np.ndarray:
+        return self.solver_counts() > 0
+
+    def level_counts(self) -> np.ndarray:
+        """레벨별로 멤버 중 한 명이라도 푼 문제 수. 길이 LEVEL_COUNT."""
+        return np.bincount(self.problem_level[self.solved_mask()], minlength=LEVEL_COUNT)
+
+    def tag_counts(self, minlength: int = 0) -> np.ndarray:
+        """태그 id별로 멤버 중 한 명이라도 푼 문제 수. 인덱스가 bojTagId다."""
+        tag_solved = np.repeat(self.solved_mask(), np.diff(self.tag_indptr))
+        return np.bincount(self.tag_ids[tag_solved], minlength=minlength)
+
+    def tier_avg(self, member_tiers: np.ndarray) -> np.ndarray:
+        """문제별로 푼 멤버들의 tier 평균(버림). member_tiers는 handles 순서."""
+        counts = self.solver_counts()
+        sums = np.bincount(self.indices, weights=member_tiers[self.entry_rows()], minlength=len(self.problem_ids))
+        return (sums // np.maximum(counts, 1)).astype(np.int64)
+
+    def solvers_by_problem(self) -> tuple[np.ndarray, np.ndarray]:
+        """열 기준(CSC) 배열. 문제 j를 푼 행 번호는 rows[indptr[j]:indptr[j + 1]]이며 handles 순서를 유지한다."""
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(len(self.problem_ids) + 1, dtype=np.int64)
+        np.cumsum(self.solver_counts(), out=indptr[1:])
+        return indptr, self.entry_rows()[order]
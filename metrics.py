@@ -0,0 +1,315 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from starlette.routing import Match
+
+import storage
+
+# 크롤링(별도 스레드)과 API(이벤트 루프)가 같은 지표를 함께 쓰므로 값은 지표마다 lock을 잡고 바꾼다.
+# /metrics는 Prometheus text format(0.0.4)으로 내보낸다.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                    for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self._samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*buckets, float("inf"))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# solved.ac 요청. endpoint는 쿼리를 뺀 경로(/user/show 등), status는 HTTP 상태 코드 또는 연결 오류면 "error"
+UPSTREAM_REQUESTS = Counter("hasjoon_upstream_requests_total", "solved.ac로 보낸 요청 수",
+                            ("endpoint", "status"))
+UPSTREAM_RETRIES = Counter("hasjoon_upstream_retries_total", "solved.ac 요청을 다시 보낸 횟수",
+                           ("endpoint", "reason"))
+UPSTREAM_BYTES = Counter("hasjoon_upstream_response_bytes_total", "solved.ac에서 받은 바이트 수 (압축된 그대로)",
+                         ("endpoint",))
+UPSTREAM_SECONDS = Histogram("hasjoon_upstream_request_duration_seconds", "solved.ac 요청 하나의 응답 시간",
+                             ("endpoint",))
+
+# 기준 데이터(태그, 레벨, 단체 랭킹) 캐시. result는 hit(요청 없음), revalidated(모두 304), refetched, stale(실패해 낡은 것 사용)
+REFERENCE_CACHE = Counter("hasjoon_reference_cache_total", "기준 데이터를 가져온 방법", ("dataset", "result"))
+
+# 크롤링. 하루에 한 번 도는 작업이라 단계별 시간은 분포 대신 마지막 크롤링의 값만 남긴다.
+CRAWL_STAGE_SECONDS = Gauge("hasjoon_crawl_stage_duration_seconds", "마지막 크롤링의 단계별 걸린 시간",
+                            ("stage",))
+CRAWL_RUNS = Counter("hasjoon_crawl_runs_total", "크롤링 횟수", ("result",))
+CRAWL_IN_PROGRESS = Gauge("hasjoon_crawl_in_progress", "크롤링 중이면 1")
+CRAWL_LAST_DURATION = Gauge("hasjoon_crawl_last_duration_seconds", "마지막 크롤링 전체에 걸린 시간")
+CRAWL_LAST_SUCCESS = Gauge("hasjoon_crawl_last_success_timestamp_seconds", "마지막으로 성공한 크롤링이 끝난 시각")
+SYNC_RETRIES = Counter("hasjoon_sync_retries_total", "크롤링 전체가 실패해 다시 시도한 횟수")
+
+# API
+HTTP_REQUEST_SECONDS = Histogram("hasjoon_http_request_duration_seconds", "API 요청 하나를 처리한 시간 (본문 전송까지)",
+                                 ("method", "route", "status"))
+
+
+def record_upstream(endpoint: str, status: int | str, seconds: float, num_bytes: int = 0) -> None:
+    UPSTREAM_REQUESTS.inc(endpoint=endpoint, status=status)
+    UPSTREAM_SECONDS.observe(seconds, endpoint=endpoint)
+    if num_bytes:
+        UPSTREAM_BYTES.inc(num_bytes, endpoint=endpoint)
+
+
+_crawl_lock = threading.Lock()
+_crawl: dict | None = None  # 진행 중이거나 마지막으로 끝난 크롤링
+_last_success_at: datetime | None = None
+
+# worker가 여럿이면 크롤링하는 프로세스는 하나뿐이므로, 크롤링 요약을 파일로도 남겨 다른 worker의 /status가 보여 준다.
+CRAWL_STATUS_PATH = os.path.join("cache", "crawl_status.json")
+
+
+def _upstream_totals() -> dict[str, float]:
+    return {"requests": UPSTREAM_REQUESTS.total(), "retries": UPSTREAM_RETRIES.total(),
+            "bytes"   : UPSTREAM_BYTES.total()}
+
+
+@contextmanager
+def track_crawl(organizations: list[str]):
+    """크롤링 한 번의 시작/끝, 걸린 시간, 그동안 보낸 요청·재시도·바이트 수를 crawl_status()에 남긴다."""
+    global _crawl, _last_success_at
+    started = time.monotonic()
+    before = _upstream_totals()
+    with _crawl_lock:
+        _crawl = {"state"         : "running",
+                  "organizations" : list(organizations),
+                  "started_at"    : datetime.now(),
+                  "finished_at"   : None,
+                  "error"         : None,
+                  "stages"        : {},
+                  "running_stages": {},
+                  "_started"      : started,
+                  "_before"       : before}
+    CRAWL_IN_PROGRESS.set(1)
+    _save_status()
+
+    error: BaseException | None = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.monotonic() - started
+        after = _upstream_totals()
+        with _crawl_lock:
+            _crawl.update({"state"      : "failed" if error is not None else "succeeded",
+                           "finished_at": datetime.now(),
+                           "duration_s" : elapsed,
+                           "error"      : f"{type(error).__name__}: {error}" if error is not None else None,
+                           **{key: int(after[key] - before[key]) for key in after}})
+            stages = dict(_crawl["stages"])
+            if error is None:
+                _last_success_at = _crawl["finished_at"]
+
+        for stage_name, seconds in stages.items():
+            CRAWL_STAGE_SECONDS.set(seconds, stage=stage_name)
+        CRAWL_LAST_DURATION.set(elapsed)
+        CRAWL_RUNS.inc(result="failure" if error is not None else "success")
+        if error is None:
+            CRAWL_LAST_SUCCESS.set(time.time())
+        CRAWL_IN_PROGRESS.set(0)
+        _save_status()
+
+
+@contextmanager
+def stage(name: str):
+    """크롤링 단계 하나의 걸린 시간을 잰다. 같은 단계를 여러 번 지나면(단체별 쓰기 등) 더한다."""
+    started = time.monotonic()
+    with _crawl_lock:
+        crawl = _crawl
+        if crawl is not None:
+            crawl["running_stages"][name] = started
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        with _crawl_lock:
+            if crawl is not None:
+                crawl["running_stages"].pop(name, None)
+                crawl["stages"][name] = crawl["stages"].get(name, 0.0) + elapsed
+
+
+async def timed(name: str, awaitable):
+    with stage(name):
+        return await awaitable
+
+
+def _own_status() -> dict | None:
+    with _crawl_lock:
+        if _crawl is None:
+            return None
+
+        status = {key: value for key, value in _crawl.items() if not key.startswith("_")}
+        status["stages"] = dict(_crawl["stages"])
+        now = time.monotonic()
+        status["running_stages"] = {name: now - started for name, started in _crawl["running_stages"].items()}
+        if status["state"] == "running":
+            after = _upstream_totals()
+            status["duration_s"] = now - _crawl["_started"]
+            status.update({key: int(after[key] - _crawl["_before"][key]) for key in after})
+        status["last_success_at"] = _last_success_at
+        return status
+
+
+def _save_status() -> None:
+    status = _own_status()
+    if status["last_success_at"] is None:
+        # 이 프로세스는 아직 성공한 적이 없어도 다른 worker가 성공했을 수 있다.
+        status["last_success_at"] = (_load_status() or {}).get("last_success_at")
+    with storage.atomic_path(CRAWL_STATUS_PATH) as tmp, open(tmp, 'w') as f:
+        json.dump(status, f, ensure_ascii=False, default=lambda value: value.isoformat())
+
+
+def _load_status() -> dict | None:
+    try:
+        with open(CRAWL_STATUS_PATH, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def crawl_status() -> dict:
+    """진행 중이거나 마지막으로 끝난 크롤링의 요약. 진행 중이면 지금까지의 값과 아직 끝나지 않은 단계를 보여 준다.
+
+    이 프로세스가 크롤링 중이 아니면, 어느 worker든 마지막으로 크롤링한 프로세스가 남긴 요약을 보여 준다.
+    """
+    status = _own_status()
+    if status is None or status["state"] != "running":
+        status = _load_status() or status
+    return status or {"state": "never", "last_success_at": None}
+
+
+class MetricsMiddleware:
+    """API 요청마다 경로 템플릿(/history/{entity} 등)별 처리 시간을 잰다. 응답 캐시에서 나간 응답도 포함하도록
+    가장 바깥에 등록한다."""
+
+    def __init__(self, app, routes: list):
+        self.app = app
+        self.routes = routes
+
+    def _route(self, scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"],
+                                         route=self._route(scope), status=status)
@@ -0,0 +1,129 @@
+import base64
+import json
+
+import numpy as np
+
+SORT_KEYS = ("problem_id", "tier_avg", "user_count")
+FIELDS = ("problem_id", "handle", "tier", "user_count", "tier_avg")
+
+
+def encode_cursor(key: int, problem_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key, problem_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        key, problem_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(key), int(problem_id)
+    except (ValueError, TypeError):
+        raise ValueError(f"invalid cursor: {cursor}")
+
+
+class ProblemIndex:
+    """problem_info를 문제 번호로 찾고, tier_avg/user_count/푼 사람으로 걸러 정렬·페이지 나누기 위한 색인.
+
+    정렬 키마다 (키, 문제 번호) 순으로 정렬한 위치 배열을 스냅샷을 만들 때 한 번 계산해 두고,
+    범위 조건과 커서는 이 배열에서 이진 탐색으로 잘라낸다.
+    """
+
+    def __init__(self, problem_info: dict[int, dict]):
+        self.records = problem_info
+        self.problem_ids = np.array(sorted(problem_info), dtype=np.int64)
+        self.columns = {
+                "problem_id": self.problem_ids,
+                "tier_avg"  : np.array([problem_info[i]["tier_avg"] for i in self.problem_ids], dtype=np.int64),
+                "user_count": np.array([problem_info[i]["user_count"] for i in self.problem_ids], dtype=np.int64),
+        }
+
+        # 정렬 키별로 (키, 문제 번호) 오름차순 위치와, 그 순서로 늘어놓은 키 값·문제 번호
+        self.orders: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for key in SORT_KEYS:
+            order = np.lexsort((self.problem_ids, self.columns[key]))
+            self.orders[key] = (order, self.columns[key][order], self.problem_ids[order])
+
+        positions_by_handle: dict[str, list[int]] = {}
+        for position, problem_id in enumerate(self.problem_ids.tolist()):
+            for handle in problem_info[problem_id]["handle"]:
+                positions_by_handle.setdefault(handle, []).append(position)
+        self.by_handle = {handle: np.array(positions, dtype=np.int64)
+                          for handle, positions in positions_by_handle.items()}
+
+    def __len__(self) -> int:
+        return len(self.problem_ids)
+
+    def get(self, problem_id: int) -> dict | None:
+        return self.records.get(problem_id)
+
+    def _project(self, problem_id: int, fields: tuple[str, ...]) -> dict:
+        record = self.records[problem_id]
+        return {field: problem_id if field == "problem_id" else record[field] for field in fields}
+
+    def query(self, handle: str | None = None,
+              tier_avg_min: int | None = None, tier_avg_max: int | None = None,
+              user_count_min: int | None = None, user_count_max: int | None = None,
+              sort: str = "problem_id", order: str = "asc", cursor: str | None = None, limit: int = 100,
+              fields: tuple[str, ...] | None = None) -> dict:
+        """조건에 맞는 문제를 sort 순서로 limit개 돌려준다.
+
+        next_cursor를 다음 호출의 cursor로 넘기면 그 뒤부터 이어서 받는다. (키, 문제 번호)로 위치를 찾으므로
+        스냅샷이 바뀌어도 이미 본 문제를 다시 받거나 건너뛰지 않는다.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {SORT_KEYS}")
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be asc or desc")
+        fields = fields or FIELDS
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"unknown fields: {sorted(unknown)}")
+
+        positions, keys, ids = self.orders[sort]
+        lo, hi = 0, len(positions)
+
+        # 정렬 키에 걸린 범위 조건은 이진 탐색으로 바로 잘라낸다.
+        ranges = {"tier_avg": (tier_avg_min, tier_avg_max), "user_count": (user_count_min, user_count_max)}
+        if sort in ranges:
+            key_min, key_max = ranges.pop(sort)
+            if key_min is not None:
+                lo = int(np.searchsorted(keys, key_min, side="left"))
+            if key_max is not None:
+                hi = int(np.searchsorted(keys, key_max, side="right"))
+
+        if cursor is not None:
+            cursor_key, cursor_id = decode_cursor(cursor)
+            # (키, 문제 번호)가 커서 바로 다음인 위치를 찾는다.
+            key_lo = int(np.searchsorted(keys, cursor_key, side="left"))
+            key_hi = int(np.searchsorted(keys, cursor_key, side="right"))
+            if order == "asc":
+                lo = max(lo, key_lo + int(np.searchsorted(ids[key_lo:key_hi], cursor_id, side="right")))
+            else:
+                hi = min(hi, key_lo + int(np.searchsorted(ids[key_lo:key_hi], cursor_id, side="left")))
+
+        selected = positions[lo:hi] if lo < hi else positions[:0]
+        if order == "desc":
+            selected = selected[::-1]
+
+        mask = None
+        for key, (key_min, key_max) in ranges.items():
+            column = self.columns[key][selected]
+            if key_min is not None:
+                mask = (column >= key_min) if mask is None else mask & (column >= key_min)
+            if key_max is not None:
+                mask = (column <= key_max) if mask is None else mask & (column <= key_max)
+        if handle is not None:
+            solved = np.isin(selected, self.by_handle.get(handle, np.empty(0, dtype=np.int64)))
+            mask = solved if mask is None else mask & solved
+        if mask is not None:
+            selected = selected[mask]
+
+        page = self.problem_ids[selected[:limit]].tolist()
+        next_cursor = None
+        if len(selected) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor(self.records[last][sort] if sort != "problem_id" else last, last)
+
+        return {
+                "problems"   : [self._project(problem_id, fields) for problem_id in page],
+                "remaining"  : len(selected),
+                "next_cursor": next_cursor,
+        }
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+
+import metrics
+import storage
+from client import SolvedacClient, SolvedacError
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_CACHE_DIR = os.path.join("cache", "reference")
+
+# 거의 바뀌지 않는 solved.ac 기준 데이터를 다시 받지 않고 쓰는 기간. 0이면 크롤링마다 (조건부로) 다시 확인한다.
+# 단체 랭킹은 고등학교 비교 화면에 그대로 보이므로, 하루 안에 다시 크롤링할 때(재시작, 재시도)만 건너뛰도록 짧게 둔다.
+REFERENCE_TTL = {
+        "tags"         : timedelta(hours=float(os.environ.get("REFERENCE_TTL_TAGS_HOURS", 168))),
+        "levels"       : timedelta(hours=float(os.environ.get("REFERENCE_TTL_LEVELS_HOURS", 24))),
+        "organizations": timedelta(hours=float(os.environ.get("REFERENCE_TTL_ORGANIZATIONS_HOURS", 12))),
+}
+
+
+class ReferenceCache:
+    """solved.ac 응답 본문을 페이지별 ETag/Last-Modified와 함께 directory/<name>.json에 저장해 둔다.
+
+    TTL 안이면 요청 없이 저장된 본문을 쓰고, 지났으면 페이지마다 If-None-Match/If-Modified-Since를 붙여 다시
+    요청한다. 304를 받은 페이지는 저장된 본문을 그대로 쓴다(solved.ac가 검증자를 주지 않으면 평범한 요청이 된다).
+    다시 받는 데 실패하면 낡았더라도 저장된 본문으로 크롤링을 이어 간다.
+    """
+
+    def __init__(self, directory: str = REFERENCE_CACHE_DIR, ttl: dict[str, timedelta] = REFERENCE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, name: str) -> dict | None:
+        try:
+            with open(self.path(name), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self, name: str, entry: dict) -> None:
+        with storage.atomic_path(self.path(name)) as tmp, open(tmp, 'w') as f:
+            json.dump(entry, f, ensure_ascii=False)
+
+    def is_fresh(self, name: str, entry: dict) -> bool:
+        fetched_at = datetime.strptime(entry['fetched_at'], "%Y-%m-%d %H:%M:%S")
+        return fetched_at >= datetime.now() - self.ttl.get(name, timedelta(0))
+
+    async def get(self, client: SolvedacClient, name: str, path: str, params: dict | None = None,
+                  paged: bool = False) -> list | dict:
+        """name의 데이터. paged면 모든 페이지의 items를 이어 붙인 목록, 아니면 응답 본문."""
+        entry = self.load(name)
+        if entry is not None and self.is_fresh(name, entry):
+            metrics.REFERENCE_CACHE.inc(dataset=name, result="hit")
+            return _assemble(entry, paged)
+
+        try:
+            fetched = await _fetch(client, path, params, entry['pages'] if entry is not None else [], paged)
+        except SolvedacError as e:
+            if entry is None:
+                raise
+            logger.warning(f"failed to refresh {name} ({e}); using the copy from {entry['fetched_at']}")
+            metrics.REFERENCE_CACHE.inc(dataset=name, result="stale")
+            return _assemble(entry, paged)
+
+        pages, revalidated = fetched
+        metrics.REFERENCE_CACHE.inc(dataset=name, result="revalidated" if revalidated else "refetched")
+        entry = {'fetched_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'pages': pages}
+        self.save(name, entry)
+        return _assemble(entry, paged)
+
+
+def _assemble(entry: dict, paged: bool) -> list | dict:
+    if not paged:
+        return entry['pages'][0]['body']
+    return [item for page in entry['pages'] for item in page['body']['items']]
+
+
+async def _fetch_page(client: SolvedacClient, path: str, params: dict, cached: dict | None) -> tuple[dict, bool]:
+    """(페이지, 304로 저장된 본문을 그대로 썼는지)"""
+    headers = {}
+    if cached is not None and cached.get('etag'):
+        headers["If-None-Match"] = cached['etag']
+    if cached is not None and cached.get('last_modified'):
+        headers["If-Modified-Since"] = cached['last_modified']
+
+    response = await client.get(path, params, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        return cached, True
+    if response.status_code != 200:
+        raise SolvedacError(f"GET {path} {params} returned HTTP {response.status_code}")
+
+    return {'params'       : params,
+            'etag'         : response.headers.get("ETag"),
+            'last_modified': response.headers.get("Last-Modified"),
+            'body'         : response.json()}, False
+
+
+async def _fetch(client: SolvedacClient, path: str, params: dict | None, cached_pages: list[dict],
+                 paged: bool) -> tuple[list[dict], bool]:
+    """모든 페이지를 (조건부로) 받는다. 모든 페이지가 304였으면 두 번째 값이 True."""
+    params = dict(params or {})
+    if not paged:
+        page, revalidated = await _fetch_page(client, path, params, cached_pages[0] if cached_pages else None)
+        return [page], revalidated
+
+    cached_by_page = {page['params']['page']: page for page in cached_pages}
+    first, first_revalidated = await _fetch_page(client, path, {**params, "page": 1}, cached_by_page.get(1))
+
+    items = first['body']['items']
+    if not items or first['body']['count'] <= len(items):
+        return [first], first_revalidated
+
+    page_count = math.ceil(first['body']['count'] / len(items))
+    rest = await asyncio.gather(*(_fetch_page(client, path, {**params, "page": number}, cached_by_page.get(number))
+                                  for number in range(2, page_count + 1)))
+    return [first, *(page for page, _ in rest)], first_revalidated and all(revalidated for _, revalidated in rest)
+
+
+_cache = ReferenceCache()
+
+
+async def get(client: SolvedacClient, name: str, path: str, params: dict | None = None,
+              paged: bool = False) -> list | dict:
+    return await _cache.get(client, name, path, params, paged)
@@ -0,0 +1,204 @@
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.routing import Match
+
+try:
+    import brotli
+except ImportError:  # brotli가 없으면 gzip으로만 압축한다.
+    brotli = None
+
+# 스냅샷 버전마다 캐시해 둘 응답 본문(압축본 포함)의 최대 크기(MB). 이보다 큰 응답 하나는 캐시하지 않는다.
+RESPONSE_CACHE_MAX_MB = float(os.environ.get("RESPONSE_CACHE_MAX_MB", 128))
+
+# 이보다 작은 응답은 압축하지 않는다.
+MIN_COMPRESS_SIZE = 1024
+
+# /metrics, /status는 스냅샷과 상관없이 바뀌므로 캐시하지 않는다.
+EXCLUDED_PATHS = ("/", "/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect", "/metrics", "/status")
+
+
+def _accepted(accept_encoding: str) -> set[str]:
+    return {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")
+            if not part.strip().endswith(";q=0")}
+
+
+def _available_encodings() -> tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+class CachedResponse:
+    """한 스냅샷 버전에서 한 URL의 응답 본문을 encodings별로 미리 압축해 둔 것."""
+
+    def __init__(self, tag: str, status: int, headers: list[tuple[bytes, bytes]], body: bytes,
+                 encodings: tuple[str, ...] = _available_encodings()):
+        self.headers = [(name, value) for name, value in headers
+                        if name.lower() not in (b"content-length", b"content-encoding", b"etag", b"cache-control")]
+        self.status = status
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self.etag = f'"{tag}-{digest}"'
+
+        self.bodies = {"identity": body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            if "gzip" in encodings:
+                self.bodies["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+            if "br" in encodings and brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=5)
+        self.size = sum(len(encoded) for encoded in self.bodies.values())
+
+    def etag_for(self, encoding: str) -> str:
+        # 인코딩이 다른 표현은 바이트가 다르므로 강한 ETag도 달라야 한다.
+        return self.etag if encoding == "identity" else f'{self.etag[:-1]}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or any(self.etag_for(encoding) in tags for encoding in self.bodies)
+
+    def select(self, accept_encoding: str) -> str:
+        accepted = _accepted(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return "identity"
+
+
+class ResponseCacheMiddleware:
+    """GET 응답을 스냅샷 버전별로 캐시해, 같은 URL은 다시 직렬화하지 않고 미리 압축한 본문으로 바로 응답한다.
+
+    version()은 현재 데이터를 나타내는 객체들의 튜플을 돌려준다. store/history는 새 데이터를 공개할 때 참조를
+    통째로 바꾸므로, 캐시를 채울 때의 버전 객체와 `is`로 비교해 하나라도 다르면 캐시 전체를 비운다.
+    tag()는 ETag 앞부분(스냅샷 시각 등), max_age()는 Cache-Control의 max-age(다음 갱신까지 남은 초)다.
+
+    캐시 키는 경로와, routes에서 찾은 경로가 선언한 쿼리 파라미터뿐이다. 선언하지 않은 파라미터는 응답을 바꾸지
+    않으므로, 이를 붙여 캐시를 우회하거나 같은 본문을 여러 벌 쌓을 수 없다. 캐시는 본문 크기 합으로 묶는다.
+    """
+
+    def __init__(self, app, version: Callable[[], tuple], tag: Callable[[], str], max_age: Callable[[], int],
+                 routes: list, max_bytes: int = int(RESPONSE_CACHE_MAX_MB * 1024 * 1024)):
+        self.app = app
+        self.version = version
+        self.tag = tag
+        self.max_age = max_age
+        self.routes = routes
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], CachedResponse] = OrderedDict()
+        self._bytes = 0
+        self._version: tuple = ()
+        self._params: dict[str, frozenset[str] | None] = {}
+
+    @staticmethod
+    def _same(a: tuple, b: tuple) -> bool:
+        return len(a) == len(b) and all(x is y for x, y in zip(a, b))
+
+    def _declared_params(self, scope) -> frozenset[str] | None:
+        """scope의 경로가 선언한 쿼리 파라미터 이름. 경로를 찾지 못했거나 알 수 없으면 None(쿼리 전체를 키로 쓴다)."""
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match != Match.FULL:
+                continue
+            if route.path not in self._params:
+                dependant = getattr(route, "dependant", None)
+                self._params[route.path] = (frozenset(param.alias for param in dependant.query_params)
+                                            if dependant is not None else None)
+            return self._params[route.path]
+        return None
+
+    def _key(self, scope) -> tuple[str, str]:
+        pairs = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        declared = self._declared_params(scope)
+        if declared is not None:
+            pairs = [(name, value) for name, value in pairs if name in declared]
+        # 파라미터 순서만 다른 URL은 같은 응답을 쓴다. 같은 이름이 여러 번 오면(hs_name 등) 그 순서는 응답에 드러나므로 유지한다.
+        return scope["path"], urlencode(sorted(pairs, key=lambda pair: pair[0]))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] in EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        key = self._key(scope)
+        version = self.version()
+        if not self._same(version, self._version):
+            self.clear()
+            self._version = version
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        else:
+            entry = await self._fill(scope, receive, send, key, version)
+            if entry is None:
+                return
+
+        request_headers = Headers(scope=scope)
+        encoding = entry.select(request_headers.get("accept-encoding", ""))
+        headers = [
+                *entry.headers,
+                (b"etag", entry.etag_for(encoding).encode()),
+                (b"cache-control", f"public, max-age={self.max_age()}".encode()),
+                (b"vary", b"Accept-Encoding"),
+        ]
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None and entry.matches(if_none_match):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = entry.bodies[encoding]
+        headers.append((b"content-length", str(len(body)).encode()))
+        if encoding != "identity":
+            headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _fill(self, scope, receive, send, key: tuple[str, str], version: tuple) -> CachedResponse | None:
+        """앱을 호출해 응답을 받는다. 캐시할 수 있는 응답(200 JSON)이면 캐시에 넣어 돌려주고,
+        아니면 받은 그대로 내보내고 None을 돌려준다."""
+        messages = []
+
+        async def capture(message):
+            messages.append(message)
+
+        await self.app(scope, receive, capture)
+
+        start = messages[0]
+        headers = Headers(raw=start["headers"])
+        if start["status"] != 200 or not headers.get("content-type", "").startswith("application/json"):
+            for message in messages:
+                await send(message)
+            return None
+
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+
+        # 응답을 만드는 동안 새 스냅샷이 공개됐거나, 혼자서 캐시 크기를 넘는 응답이면 캐시하지 않으므로
+        # 이 요청이 받아들이는 인코딩 하나만 만든다.
+        if not self._same(version, self._version) or len(body) > self.max_bytes:
+            accepted = _accepted(Headers(scope=scope).get("accept-encoding", ""))
+            encodings = tuple(encoding for encoding in _available_encodings() if encoding in accepted)[:1]
+            return await run_in_threadpool(CachedResponse, self.tag(), start["status"], start["headers"], body,
+                                           encodings)
+
+        # 처음 한 번만 압축하므로 큰 응답도 이벤트 루프를 막지 않도록 스레드에서 만든다.
+        entry = await run_in_threadpool(CachedResponse, self.tag(), start["status"], start["headers"], body)
+        if not self._same(version, self._version) or entry.size > self.max_bytes:
+            return entry
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+        return entry
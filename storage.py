@@ -0,0 +1,235 @@
+import json
+import os
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow가 없으면 csv 형식만 쓸 수 있다.
+    pa = None
+
+# 크롤링 결과와 history를 저장하는 형식
+#   csv     : 기존과 같은 CSV + problem_info.json (기본값)
+#   arrow   : 압축하지 않은 Arrow IPC(Feather v2) 파일. 풀거나 파싱할 것이 없어 빨리 읽지만,
+#             서버는 읽은 표를 pandas/파이썬 객체로 바꿔 쓰므로 프로세스마다 복사본을 가진다.
+#   parquet : zstd로 압축한 Parquet 파일. 가장 작아서 history에 알맞다.
+STORAGE_FORMAT = os.environ.get("STORAGE_FORMAT", "csv")
+
+# 1이면 columnar 형식으로 저장할 때 호환용 CSV/JSON도 함께 쓴다.
+STORAGE_EXPORT_CSV = os.environ.get("STORAGE_EXPORT_CSV", "0") == "1"
+
+EXTENSIONS = {"csv": "csv", "arrow": "arrow", "parquet": "parquet"}
+
+# 단체별 결과는 organizations/<organization_id>/ 아래에, 서비스할 단체 목록은 organizations/index.json에 저장한다.
+ORGANIZATION_DIR = "organizations"
+ORGANIZATION_INDEX_PATH = os.path.join(ORGANIZATION_DIR, "index.json")
+
+if pa is not None:
+    SCHEMAS = {
+            "user_data"             : pa.schema([
+                    ("handle", pa.string()),
+                    ("solved_count", pa.int32()),
+                    ("vote_count", pa.int32()),
+                    ("class", pa.int8()),
+                    ("class_decoration", pa.string()),
+                    ("tier", pa.int8()),
+                    ("rating", pa.int32()),
+                    ("coins", pa.int64()),
+                    ("stardusts", pa.int64()),
+                    ("solved_rank", pa.int32()),
+                    ("boj_rank", pa.int32()),
+                    ("solved_rank_all", pa.int64()),
+            ]),
+            "organization_data"     : pa.schema([
+                    ("rank", pa.int32()),
+                    ("count", pa.int32()),
+                    ("user_count", pa.int32()),
+                    ("solved_count", pa.int32()),
+                    ("vote_count", pa.int32()),
+                    ("name", pa.string()),
+                    ("rating", pa.int32()),
+                    ("rank_high_school", pa.int32()),
+            ]),
+            "problem_count_by_level": pa.schema([
+                    ("level", pa.int8()),
+                    ("count", pa.int32()),
+                    ("solved_count", pa.int32()),
+            ]),
+            "problem_count_by_tag"  : pa.schema([
+                    ("tag_id", pa.int32()),
+                    ("ko", pa.string()),
+                    ("en", pa.string()),
+                    ("count", pa.int32()),
+                    ("solved_count", pa.int32()),
+            ]),
+            "high_school_data"      : pa.schema([
+                    ("organization_id", pa.int32()),
+                    ("name", pa.string()),
+                    ("type", pa.string()),
+                    ("rating", pa.int32()),
+                    ("user_count", pa.int32()),
+                    ("vote_count", pa.int32()),
+                    ("solved_count", pa.int32()),
+                    ("color", pa.string()),
+                    ("rank", pa.int32()),
+                    ("global_rank", pa.int32()),
+            ]),
+            "history"               : pa.schema([
+                    ("entity", pa.string()),
+                    ("key", pa.string()),
+                    ("field", pa.string()),
+                    ("date", pa.string()),
+                    ("value", pa.int64()),
+            ]),
+            "problem_info"          : pa.schema([
+                    ("problem_id", pa.int32()),
+                    ("handle", pa.list_(pa.string())),
+                    ("tier", pa.list_(pa.int8())),
+                    ("user_count", pa.int32()),
+                    ("tier_avg", pa.int8()),
+            ]),
+    }
+
+
+@contextmanager
+def atomic_path(path: str):
+    """path 대신 쓸 임시 경로를 내주고, 블록이 끝나면 path로 바꿔치기한다.
+
+    읽는 쪽(다른 worker, 다음 크롤링)이 쓰다 만 파일을 보지 않고, 쓰는 도중 죽어도 이전 파일이 남는다.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    yield tmp
+    os.replace(tmp, path)
+
+
+def atomic_write(path: str, data: str | bytes) -> None:
+    with atomic_path(path) as tmp:
+        with open(tmp, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+
+
+def _require_pyarrow(fmt: str) -> None:
+    if fmt != "csv" and pa is None:
+        raise RuntimeError(f"STORAGE_FORMAT={fmt} requires pyarrow")
+
+
+def table_path(name: str, directory: str = ".", fmt: str = STORAGE_FORMAT) -> str:
+    if fmt == "csv" and name.startswith("problem_info"):
+        return os.path.join(directory, f"{name}.json")
+    return os.path.join(directory, f"{name}.{EXTENSIONS[fmt]}")
+
+
+def _schema_for(name: str):
+    # history 파일은 "user_data_2024-01-01"처럼 날짜가 붙으므로 가장 긴 접두사의 스키마를 쓴다.
+    for table in sorted(SCHEMAS, key=len, reverse=True):
+        if name.startswith(table):
+            return SCHEMAS[table]
+    return None
+
+
+def _write_arrow_table(table, path: str, fmt: str) -> None:
+    with atomic_path(path) as tmp:
+        if fmt == "arrow":
+            feather.write_feather(table, tmp, compression="uncompressed")
+        else:
+            pq.write_table(table, tmp, compression="zstd")
+
+
+def _read_arrow_table(path: str, fmt: str):
+    # 읽은 표는 곧바로 pandas/파이썬 객체로 바꾸므로 memory map으로 열어도 프로세스끼리 나눠 쓰는 것이 없다.
+    if fmt == "arrow":
+        return feather.read_table(path)
+    return pq.read_table(path)
+
+
+def save_frame(df: pd.DataFrame, name: str, directory: str = ".", fmt: str = STORAGE_FORMAT) -> str:
+    _require_pyarrow(fmt)
+    os.makedirs(directory, exist_ok=True)
+    path = table_path(name, directory, fmt)
+
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return path
+
+    # 고등학교가 아닌 단체의 rank_high_school, 빈 멤버 목록의 solved_rank처럼 없는 열은 CSV와 같이 빼고 쓴다.
+    schema = _schema_for(name)
+    if schema is not None:
+        schema = pa.schema([field for field in schema if field.name in df.columns])
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    _write_arrow_table(table, path, fmt)
+
+    if STORAGE_EXPORT_CSV:
+        save_frame(df, name, directory, "csv")
+    return path
+
+
+def load_frame(name: str, directory: str = ".", fmt: str = STORAGE_FORMAT, **csv_options) -> pd.DataFrame:
+    """csv_options는 CSV로 읽을 때만 pd.read_csv에 넘긴다. (숫자처럼 보이는 handle을 문자열로 읽을 때 등)
+
+    columnar 형식은 저장할 때의 스키마를 그대로 따른다.
+    """
+    _require_pyarrow(fmt)
+    path = table_path(name, directory, fmt)
+
+    if fmt == "csv":
+        return pd.read_csv(path, **csv_options)
+    return _read_arrow_table(path, fmt).to_pandas()
+
+
+def save_problem_info(problem_info: dict, name: str = "problem_info", directory: str = ".",
+                      fmt: str = STORAGE_FORMAT) -> str:
+    _require_pyarrow(fmt)
+    os.makedirs(directory, exist_ok=True)
+    path = table_path(name, directory, fmt)
+
+    if fmt == "csv":
+        with open(path, 'w') as f:
+            json.dump(problem_info, f, ensure_ascii=False, indent=4)
+        return path
+
+    table = pa.table({
+            "problem_id": list(problem_info.keys()),
+            "handle"    : [value["handle"] for value in problem_info.values()],
+            "tier"      : [value["tier"] for value in problem_info.values()],
+            "user_count": [value["user_count"] for value in problem_info.values()],
+            "tier_avg"  : [value["tier_avg"] for value in problem_info.values()],
+    }, schema=SCHEMAS["problem_info"])
+    _write_arrow_table(table, path, fmt)
+
+    if STORAGE_EXPORT_CSV:
+        save_problem_info(problem_info, name, directory, "csv")
+    return path
+
+
+def load_problem_info(name: str = "problem_info", directory: str = ".",
+                      fmt: str = STORAGE_FORMAT) -> dict[int, dict]:
+    _require_pyarrow(fmt)
+    path = table_path(name, directory, fmt)
+
+    if fmt == "csv":
+        with open(path, 'r') as f:
+            return {int(problem_id): value for problem_id, value in json.load(f).items()}
+
+    # 행마다 dict를 만드는 to_pylist()보다 열 단위로 바꾼 뒤 묶는 편이 빠르다.
+    table = _read_arrow_table(path, fmt)
+    columns = [table.column(name).to_pylist() for name in SCHEMAS["problem_info"].names]
+    return {problem_id: {"handle": handle, "tier": tier, "user_count": user_count, "tier_avg": tier_avg}
+            for problem_id, handle, tier, user_count, tier_avg in zip(*columns)}
+
+
+def organization_dir(organization_id: int, root: str = ORGANIZATION_DIR) -> str:
+    return os.path.join(root, str(organization_id))
+
+
+def save_organization_index(organizations: list[dict], path: str = ORGANIZATION_INDEX_PATH) -> None:
+    """[{'organization_id': ..., 'name': ...}] 형식의 단체 목록. 첫 번째 단체가 기본 단체다."""
+    atomic_write(path, json.dumps(organizations, ensure_ascii=False, indent=4))
+
+
+def load_organization_index(path: str = ORGANIZATION_INDEX_PATH) -> list[dict]:
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,182 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+import storage
+from high_school_index import HighSchoolIndex
+from leaderboard import Leaderboard
+from problem_index import ProblemIndex
+
+
+def encode_user_cursor(handle: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps(handle).encode()).decode()
+
+
+def decode_user_cursor(cursor: str) -> str:
+    try:
+        handle = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"invalid cursor: {cursor}")
+    if not isinstance(handle, str):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return handle
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """한 번의 크롤링 결과를 메모리에 올려 둔 읽기 전용 묶음.
+
+    요청을 처리할 때마다 파일을 다시 읽지 않도록, 엔드포인트가 쓰는 형태로 미리 변환하고 색인해 둔다.
+    """
+    organization_id: int
+    updated_at: datetime
+    user_data: pd.DataFrame
+    organization_data: pd.DataFrame
+    problem_by_level: pd.DataFrame
+    problem_by_tag: pd.DataFrame
+    high_school_data: pd.DataFrame
+    problem_info: dict[int, dict]
+    # 모든 단체가 같은 고등학교 랭킹을 쓰므로 load_snapshots()가 한 번 만들어 넘긴다. 없으면 여기서 만든다.
+    high_school_index: HighSchoolIndex | None = None
+
+    user_records: list[dict] = field(init=False)
+    user_positions: dict[str, int] = field(init=False)
+    organization_record: dict = field(init=False)
+    level_records: list[dict] = field(init=False)
+    level_index: dict[int, list[dict]] = field(init=False)
+    tag_records: list[dict] = field(init=False)
+    tag_index: dict[int, list[dict]] = field(init=False)
+    problem_index: ProblemIndex = field(init=False)
+    leaderboard: Leaderboard = field(init=False)
+
+    def __post_init__(self):
+        level_records = self.problem_by_level.to_dict(orient="records")
+        tag_records = self.problem_by_tag.to_dict(orient="records")
+
+        level_index: dict[int, list[dict]] = {}
+        for record in level_records:
+            level_index.setdefault(record['level'], []).append(record)
+
+        tag_index: dict[int, list[dict]] = {}
+        for record in tag_records:
+            tag_index.setdefault(record['tag_id'], []).append(record)
+
+        # frozen dataclass이므로 object.__setattr__로 한 번만 채운다.
+        user_records = self.user_data.fillna('null').to_dict(orient="records")
+        object.__setattr__(self, 'user_records', user_records)
+        object.__setattr__(self, 'user_positions',
+                           {record['handle']: position for position, record in enumerate(user_records)})
+        object.__setattr__(self, 'organization_record', self.organization_data.to_dict(orient="records")[0])
+        object.__setattr__(self, 'level_records', level_records)
+        object.__setattr__(self, 'level_index', level_index)
+        object.__setattr__(self, 'tag_records', tag_records)
+        object.__setattr__(self, 'tag_index', tag_index)
+        if self.high_school_index is None:
+            object.__setattr__(self, 'high_school_index', HighSchoolIndex(self.high_school_data))
+        object.__setattr__(self, 'problem_index', ProblemIndex(self.problem_info))
+        object.__setattr__(self, 'leaderboard', Leaderboard(self.user_data, user_records, self.user_positions))
+
+    def query_users(self, fields: tuple[str, ...] | None = None, limit: int = 100, cursor: str | None = None) -> dict:
+        """user_records를 저장된 순서(rating 내림차순)로 limit개씩 돌려준다.
+
+        next_cursor를 다음 호출의 cursor로 넘기면 그 뒤부터 이어서 받는다. fields로 필요한 열만 고른다.
+        """
+        columns = tuple(self.user_data.columns)
+        fields = fields or columns
+        unknown = set(fields) - set(columns)
+        if unknown:
+            raise ValueError(f"unknown fields: {sorted(unknown)}")
+
+        start = 0
+        if cursor is not None:
+            position = self.user_positions.get(decode_user_cursor(cursor))
+            if position is None:
+                raise ValueError(f"invalid cursor: {cursor}")
+            start = position + 1
+
+        page = self.user_records[start:start + limit]
+        next_cursor = None
+        if start + limit < len(self.user_records):
+            next_cursor = encode_user_cursor(page[-1]['handle'])
+
+        return {
+                "user_data"  : [{field: record[field] for field in fields} for record in page],
+                "remaining"  : len(self.user_records) - start,
+                "next_cursor": next_cursor,
+        }
+
+
+def load_snapshot(organization_id: int, updated_at: datetime, high_school_data: pd.DataFrame,
+                  high_school_index: HighSchoolIndex | None = None) -> Snapshot:
+    """crawl.main()이 organizations/<organization_id>/에 쓴 파일들을 읽어 Snapshot을 만든다."""
+    directory = storage.organization_dir(organization_id)
+
+    return Snapshot(
+            organization_id=organization_id,
+            updated_at=updated_at,
+            user_data=storage.load_frame("user_data", directory),
+            organization_data=storage.load_frame("organization_data", directory),
+            problem_by_level=storage.load_frame("problem_count_by_level", directory),
+            problem_by_tag=storage.load_frame("problem_count_by_tag", directory),
+            high_school_data=high_school_data,
+            problem_info=storage.load_problem_info(directory=directory),
+            high_school_index=high_school_index,
+    )
+
+
+def load_snapshots() -> dict[str, Snapshot]:
+    """organizations/index.json에 적힌 단체마다 Snapshot을 만든다. 고등학교 랭킹은 모든 단체가 함께 쓴다."""
+    with open("updated_at.txt", "r") as f:
+        updated_at = datetime.strptime(f.read(), "%Y-%m-%d %H:%M:%S")
+
+    high_school_data = storage.load_frame("high_school_data")
+    high_school_index = HighSchoolIndex(high_school_data)
+    return {organization['name']: load_snapshot(organization['organization_id'], updated_at, high_school_data,
+                                                high_school_index)
+            for organization in storage.load_organization_index()}
+
+
+# 단체 이름 -> 스냅샷. 첫 번째 단체가 organization을 지정하지 않은 요청에 쓰는 기본 단체다.
+_current: dict[str, Snapshot] = {}
+
+
+def get(organization: str | None = None) -> Snapshot | None:
+    """organization(이름 또는 organization_id)의 현재 스냅샷. 없으면 None.
+
+    읽는 쪽은 한 요청 안에서 이 반환값 하나만 사용해야 일관된 데이터를 본다.
+    """
+    snapshots = _current
+    if not snapshots:
+        return None
+    if organization is None:
+        return next(iter(snapshots.values()))
+
+    snapshot = snapshots.get(organization)
+    if snapshot is None and organization.isdigit():
+        snapshot = next((snapshot for snapshot in snapshots.values()
+                         if snapshot.organization_id == int(organization)), None)
+    return snapshot
+
+
+def snapshots() -> dict[str, Snapshot]:
+    """현재 공개된 전체 스냅샷. 새 스냅샷이 공개되면 다른 객체로 바뀌므로 버전 비교에도 쓴다."""
+    return _current
+
+
+def organizations() -> list[dict]:
+    return [{"organization_id": snapshot.organization_id, "name": name} for name, snapshot in _current.items()]
+
+
+def publish(snapshots: dict[str, Snapshot]) -> None:
+    """모든 단체의 스냅샷을 한꺼번에 바꾼다. 이미 진행 중인 요청은 이전 스냅샷을 그대로 본다."""
+    global _current
+    _current = dict(snapshots)
+
+
+def reload() -> dict[str, Snapshot]:
+    snapshots = load_snapshots()
+    publish(snapshots)
+    return snapshots